@@ -1,9 +1,10 @@
 import streamlit as st
-import asyncio
 import pandas as pd
 import time
 from pipeline_controller import RefineryPipeline
-from workflow_db import WorkflowDB
+from fetch_service import get_background_loop
+from workflow_db import PAGE_SIZE
+from progress import ProgressTracker, REFRESH_INTERVAL
 
 st.set_page_config(page_title="Autonomous Data Refinery", layout="wide", page_icon="⚙️")
 
@@ -57,43 +58,49 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- INITIALIZATION ---
-if 'pipeline' not in st.session_state: st.session_state.pipeline = RefineryPipeline()
-if 'logs' not in st.session_state: st.session_state.logs = []
+# Runs execute on one process-wide loop, so browsers stay warm across reruns
+background = get_background_loop()
+if 'pipeline' not in st.session_state:
+    st.session_state.pipeline = RefineryPipeline(fetch_service=background.fetch_service())
+    background.submit(st.session_state.pipeline.fetch_service.warm())
+if 'tracker' not in st.session_state: st.session_state.tracker = ProgressTracker()
 if 'running' not in st.session_state: st.session_state.running = False
-if 'current_phase' not in st.session_state: st.session_state.current_phase = 0
+if 'resume_run' not in st.session_state: st.session_state.resume_run = None
 
-db = WorkflowDB()
+db = st.session_state.pipeline.db
 
 # --- SIDEBAR ---
 with st.sidebar:
     st.header("⚙️ Configuration")
     uploaded_file = st.file_uploader("Upload doctor_names.txt", type=['txt'])
+    st.session_state.pipeline.workers = st.number_input("Parallel doctors", 1, 32, st.session_state.pipeline.workers)
+    st.session_state.pipeline.per_host = st.number_input("Fetches per host", 1, 8, st.session_state.pipeline.per_host)
     
     st.divider()
     c1, c2 = st.columns(2)
     
     if c1.button("🗑️ Wipe DB"):
         db.clear_database()
-        st.session_state.logs = []
-        st.session_state.current_phase = 0
+        st.session_state.tracker.clear_lines()
+        st.session_state.tracker.reset()
         st.success("Database Wiped!")
         time.sleep(0.5)
         st.rerun()
         
     if c2.button("🧹 Clear Logs"):
-        st.session_state.logs = []
+        st.session_state.tracker.clear_lines()
         st.rerun()
 
 # --- MAIN DASHBOARD ---
 st.title("🏭 Autonomous Data Refinery")
 
-# Metrics
-df = db.get_dataframe()
+# Metrics (aggregate queries, the table itself is paginated below)
+counts = db.status_counts()
 c1, c2, c3, c4 = st.columns(4)
-c1.metric("Total Records", len(df) if not df.empty else 0)
-c2.metric("Verified", len(df[df['status']=='Verified']) if not df.empty else 0)
-c3.metric("Enriched", len(df[df['status']=='Enriched']) if not df.empty else 0)
-c4.metric("Manual Review", len(df[df['status']=='Manual_Review']) if not df.empty else 0)
+c1.metric("Total Records", sum(counts.values()))
+c2.metric("Verified", counts.get('Verified', 0))
+c3.metric("Enriched", counts.get('Enriched', 0))
+c4.metric("Manual Review", counts.get('Manual_Review', 0))
 
 st.divider()
 
@@ -114,20 +121,47 @@ def render_progress_bar(phase):
 
 # Placeholder for the bar so we can update it
 prog_placeholder = st.empty()
-prog_placeholder.markdown(render_progress_bar(st.session_state.current_phase), unsafe_allow_html=True)
+prog_placeholder.markdown(render_progress_bar(st.session_state.tracker.phase), unsafe_allow_html=True)
+
+# Live run counters, refreshed together with the terminal
+live_placeholder = st.empty()
+
+def render_live(tracker):
+    counts = tracker.status_counts
+    with live_placeholder.container():
+        cols = st.columns(6)
+        cols[0].metric("Scraped", counts["Scraped"])
+        cols[1].metric("Verified", counts["Verified"])
+        cols[2].metric("Queued", counts["Queued"])
+        cols[3].metric("Enriched", counts["Enriched"])
+        cols[4].metric("Failed", counts["Failed"] + counts["Error"])
+        cols[5].metric("Doctors / min", f"{tracker.throughput():.1f}")
+
+if st.session_state.tracker.status_counts: render_live(st.session_state.tracker)
 
 # --- CONTROLS & TERMINAL ---
 col_ctrl, col_term = st.columns([1, 1])
 
 with col_ctrl:
     st.subheader("🕹️ Mission Control")
-    if st.button("▶ START AUTO MODE", disabled=st.session_state.running, type="primary"):
+    b1, b2 = st.columns(2)
+    if b1.button("▶ START AUTO MODE", disabled=st.session_state.running, type="primary"):
         if uploaded_file:
+            st.session_state.resume_run = None
             st.session_state.running = True
             st.rerun()
         else:
             st.error("⚠️ Upload a file first!")
 
+    if b2.button("⏯ RESUME LAST RUN", disabled=st.session_state.running):
+        last = db.last_unfinished_run()
+        if last:
+            st.session_state.resume_run = last
+            st.session_state.running = True
+            st.rerun()
+        else:
+            st.info("No interrupted run to resume.")
+
     if st.button("⏹ EMERGENCY STOP"):
         st.session_state.pipeline.stop()
         st.session_state.running = False
@@ -138,39 +172,42 @@ with col_term:
     term_placeholder = st.empty()
     
     def update_terminal():
-        # Show last 15 lines
-        content = "\n".join(st.session_state.logs[-20:])
+        # Show last 20 lines of the ring buffer
+        content = "\n".join(st.session_state.tracker.tail(20))
         term_placeholder.markdown(f'<div class="terminal-box">{content}</div>', unsafe_allow_html=True)
     
     update_terminal()
 
 # --- PIPELINE EXECUTION ---
-if st.session_state.running and uploaded_file:
-    doctors = uploaded_file.getvalue().decode("utf-8").splitlines()
-    doctors = [d.strip() for d in doctors if d.strip()]
+if st.session_state.running and (uploaded_file or st.session_state.resume_run):
+    if st.session_state.resume_run:
+        run_id, doctors = st.session_state.resume_run
+    else:
+        run_id = None
+        doctors = uploaded_file.getvalue().decode("utf-8").splitlines()
+        doctors = [d.strip() for d in doctors if d.strip()]
     
-    async def run_loop():
-        # Listen to the generator
-        async for msg in st.session_state.pipeline.run(doctors):
-            
-            # 1. Update Progress Bar if it's a PHASE signal
-            if msg.startswith("PHASE:"):
-                try:
-                    p_num = int(msg.split(":")[1])
-                    st.session_state.current_phase = p_num
-                    prog_placeholder.markdown(render_progress_bar(p_num), unsafe_allow_html=True)
-                except: pass
-            
-            # 2. Update Terminal for normal messages
-            else:
-                timestamp = time.strftime("%H:%M:%S")
-                log_entry = f"[{timestamp}] {msg}"
-                st.session_state.logs.append(log_entry)
-                update_terminal()
-            
-    asyncio.run(run_loop())
+    tracker = st.session_state.tracker
+    tracker.reset()
+
+    def redraw():
+        prog_placeholder.markdown(render_progress_bar(tracker.phase), unsafe_allow_html=True)
+        render_live(tracker)
+        update_terminal()
+
+    # Events land in the tracker; the UI redraws on a timer, not per event,
+    # and the stream's heartbeat keeps that timer going between events
+    last_draw = 0.0
+    run = st.session_state.pipeline.run(doctors, resume=run_id is not None, run_id=run_id)
+    for event in background.stream(run, heartbeat=REFRESH_INTERVAL):
+        if event is not None: tracker.record(event)
+        if time.time() - last_draw >= REFRESH_INTERVAL:
+            redraw()
+            last_draw = time.time()
+    redraw()
     
     st.session_state.running = False
+    st.session_state.resume_run = None
     st.success("✅ Workflow Complete!")
     time.sleep(1)
     st.rerun()
@@ -178,6 +215,13 @@ if st.session_state.running and uploaded_file:
 # --- DATABASE TABLE ---
 st.divider()
 with st.expander("🗄️ View Complete Database", expanded=True):
+    f1, f2 = st.columns(2)
+    status_filter = f1.selectbox("Status", ["All"] + sorted(counts))
+    status_filter = None if status_filter == "All" else status_filter
+    n_rows = counts.get(status_filter, 0) if status_filter else sum(counts.values())
+    n_pages = max(1, -(-n_rows // PAGE_SIZE))
+    page = f2.number_input(f"Page (of {n_pages})", 1, n_pages, 1) - 1
+    df = db.get_page(page, PAGE_SIZE, status_filter)
     if not df.empty:
         st.dataframe(
             df, 
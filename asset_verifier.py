@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import weakref
+import zipfile
+import zlib
+from typing import Dict, List, Optional
+import httpx
+from cache_store import DiskCache, content_key, normalize_url
+from field_extractor import validate_field
+from metrics import METRICS
+from name_index import person_tokens, profile_npi
+
+# --- CONFIGURATION ---
+ASSET_STORE_DIR = "asset_store"          # Downloaded files, one per content hash
+ASSET_CACHE_PATH = "asset_cache.db"      # url + needles -> verdict
+ASSET_CACHE_MAX_BYTES = 16 * 1024 * 1024
+ASSET_TTL = 7 * 24 * 3600
+ASSET_MAX_BYTES = 4 * 1024 * 1024        # Bytes fetched per asset (Range request + hard cut)
+ASSET_INFLATE_MAX = 16 * 1024 * 1024     # Decompressed PDF stream bytes scanned per asset
+ASSET_CONCURRENCY = 8
+ASSET_PER_PROFILE = 4
+ASSET_TIMEOUT = 20
+CHUNK_BYTES = 64 * 1024
+ASSET_SCAN_VERSION = 2                   # Bump whenever matching changes (invalidates cached verdicts)
+LICENSE_MIN_CHARS = 5                    # Shorter license numbers turn up in any document by chance
+ALLOWED_TYPES = ("application/pdf", "application/msword", "application/vnd.openxmlformats",
+                 "application/octet-stream")
+
+# --- STREAMING SCANNERS ---
+class NeedleScanner:
+    """
+    Incremental case-insensitive search for labelled needles in extracted
+    text. A needle only counts on word boundaries (license '4521' does not
+    match '14521' or 'MD4521X'); a tail of the previous chunk is kept so
+    matches across chunk boundaries are found. Call feed(b"", final=True)
+    once the text ends.
+    """
+    MARGIN = 2   # Bytes of context checked on each side (one UTF-16 code unit)
+
+    def __init__(self, needles: Dict[str, List[bytes]]):
+        self.patterns = {label: [_bounded(n.lower()) for n in variants if n] for label, variants in needles.items()}
+        self.overlap = max((len(n) for v in needles.values() for n in v), default=0) + 2 * self.MARGIN
+        self.tail = b""
+        self.found = set()
+
+    def feed(self, data: bytes, final: bool = False):
+        if len(self.found) == len(self.patterns): return
+        buf = self.tail + data.lower()
+        lo = self.MARGIN if self.tail else 0      # Tail bytes before this only give context
+        hi = len(buf) if final else len(buf) - self.MARGIN
+        for label, patterns in self.patterns.items():
+            if label in self.found: continue
+            if any(lo <= m.start() and m.end() <= hi for p in patterns for m in p.finditer(buf)):
+                self.found.add(label)
+        self.tail = b"" if final else buf[-self.overlap:]
+
+def _bounded(needle: bytes) -> "re.Pattern":
+    """`needle` not touching a letter/digit, as UTF-8 or (for UTF-16LE needles) as code units."""
+    word = rb"[a-z0-9]\x00" if needle[1:2] == b"\x00" else rb"[a-z0-9]"
+    return re.compile(rb"(?<!" + word + rb")" + re.escape(needle) + rb"(?!" + word + rb")")
+
+class XmlText:
+    """
+    Strips tags from streamed Office XML into `sink`, so attribute values
+    (widths, revision ids) are never searched; paragraph and line breaks
+    become spaces.
+    """
+    BREAKS = (b"/w:p", b"w:br", b"w:tab")
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.tag = None   # Start of the tag being skipped, None outside tags
+
+    def feed(self, data: bytes):
+        out, i = [], 0
+        while i < len(data):
+            if self.tag is None:
+                j = data.find(b"<", i)
+                if j < 0:
+                    out.append(data[i:])
+                    break
+                out.append(data[i:j])
+                self.tag, i = b"", j + 1
+            else:
+                j = data.find(b">", i)
+                self.tag = (self.tag + data[i:j if j >= 0 else len(data)])[:8]
+                if j < 0: break
+                if self.tag.startswith(self.BREAKS): out.append(b" ")
+                self.tag, i = None, j + 1
+        self.sink(b"".join(out))
+
+class PdfInflater:
+    """
+    Spots `stream ... endstream` bodies in PDF bytes as they arrive and
+    inflates FlateDecode ones incrementally into `sink`, so text inside
+    compressed content streams is searchable without buffering the file.
+    Streams that are not zlib data are skipped.
+    """
+    def __init__(self, sink, limit: int = ASSET_INFLATE_MAX):
+        self.sink = sink
+        self.left = limit
+        self.buf = b""
+        self.inflater = None     # zlib object while inside a stream, False when skipping one
+
+    def feed(self, data: bytes):
+        if self.left <= 0: return
+        self.buf += data
+        while self.left > 0:
+            if self.inflater is None:
+                i = self.buf.find(b"stream")
+                if i < 0:
+                    self.buf = self.buf[-8:]
+                    return
+                if i + 8 > len(self.buf):
+                    self.buf = self.buf[max(i - 3, 0):]
+                    return
+                j = i + 6
+                if self.buf[i - 3:i] == b"end" or self.buf[j:j + 1] not in (b"\r", b"\n"):
+                    self.buf = self.buf[j:]
+                    continue
+                j += 2 if self.buf[j:j + 2] == b"\r\n" else 1
+                self.inflater = zlib.decompressobj()
+                self.buf = self.buf[j:]
+            end = self.buf.find(b"endstream")
+            # Hold back a few bytes that might be the start of "endstream"
+            body, self.buf = (self.buf[:end], self.buf[end + 9:]) if end >= 0 else (self.buf[:-9], self.buf[-9:])
+            if self.inflater:
+                try:
+                    out = self.inflater.decompress(body, self.left)
+                    self.left -= len(out)
+                    self.sink(out)
+                except zlib.error:
+                    self.inflater = False
+            if end < 0: return
+            self.inflater = None
+
+# --- VERIFIER ---
+def build_needles(name: str, profile: dict) -> Dict[str, List[bytes]]:
+    """NPI, license and every name token, as UTF-8 and UTF-16LE (old .doc files)."""
+    license_id = validate_field("license_id", profile.get("license_id"))
+    if license_id and len(re.sub(r"[^A-Za-z0-9]", "", license_id)) < LICENSE_MIN_CHARS: license_id = None
+    raw = {"npi": profile_npi(profile), "license": license_id}
+    raw.update({f"name:{t}": t for t in person_tokens(name) if len(t) > 2})
+    return {label: [v.encode("utf-8"), v.encode("utf-16-le")] for label, v in raw.items() if v}
+
+def is_verified(found, needles) -> bool:
+    """An ID on the document, or the doctor's full name."""
+    names = [l for l in needles if l.startswith("name:")]
+    return bool({"npi", "license"} & set(found)) or (bool(names) and all(l in found for l in names))
+
+class AssetVerifier:
+    """
+    Downloads profile documents concurrently and checks their text for the
+    doctor's name/NPI/license while they stream in: inflated PDF streams,
+    DOCX body XML, or the raw bytes of a legacy .doc. Each download is capped at
+    ASSET_MAX_BYTES (HEAD first, then a Range request) and kept once per
+    content hash under ASSET_STORE_DIR; verdicts are cached per URL.
+    """
+    def __init__(self, store_dir: str = ASSET_STORE_DIR, max_concurrency: int = ASSET_CONCURRENCY,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.client = httpx.AsyncClient(
+            timeout=ASSET_TIMEOUT, follow_redirects=True, transport=transport,
+            limits=httpx.Limits(max_connections=max_concurrency * 2),
+            headers={"User-Agent": "Mozilla/5.0 (compatible; asset-verifier)"}
+        )
+        self.sem = asyncio.Semaphore(max_concurrency)
+        self.store_dir = store_dir
+        self.cache = DiskCache(ASSET_CACHE_PATH, ASSET_CACHE_MAX_BYTES)
+        os.makedirs(store_dir, exist_ok=True)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def check(self, url: str, needles: Dict[str, List[bytes]]) -> Optional[dict]:
+        key = content_key(normalize_url(url), ASSET_SCAN_VERSION,
+                          sorted((k, [n.hex() for n in v]) for k, v in needles.items()))
+        cached = self.cache.get(key)
+        if cached is not None: return cached or None
+        async with self.sem:
+            try:
+                result = await self._fetch_and_scan(url, needles)
+            except (httpx.HTTPError, OSError, zipfile.BadZipFile) as e:
+                print(f"│ ⚠️  Asset check failed ({url}): {e}")
+                METRICS.inc("assets", result="error")
+                return None   # Transient; not cached
+        self.cache.put(key, result or {}, ttl=ASSET_TTL)
+        return result
+
+    async def _fetch_and_scan(self, url: str, needles) -> Optional[dict]:
+        try:
+            head = await self.client.head(url)
+        except httpx.HTTPError:
+            head = None   # Some servers drop HEAD; the capped GET still protects us
+        if head is not None and head.status_code < 400:
+            size = int(head.headers.get("content-length") or 0)
+            ctype = head.headers.get("content-type", "").lower()
+            if size > ASSET_MAX_BYTES and "bytes" not in head.headers.get("accept-ranges", ""):
+                METRICS.inc("assets", result="too_large")
+                return None
+            if ctype and not ctype.startswith(ALLOWED_TYPES):
+                METRICS.inc("assets", result="wrong_type")
+                return None
+        elif head is not None and head.status_code in (404, 410):
+            METRICS.inc("assets", result="missing")
+            return None
+
+        scanner = NeedleScanner(needles)
+        sha = hashlib.sha256()
+        total, scan = 0, None
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                headers = {"Range": f"bytes=0-{ASSET_MAX_BYTES - 1}"}
+                with METRICS.timer("asset_fetch"):
+                    async with self.client.stream("GET", url, headers=headers) as resp:
+                        if resp.status_code >= 400:
+                            METRICS.inc("assets", result="missing")
+                            return None
+                        ctype = resp.headers.get("content-type", "").lower()
+                        async for chunk in resp.aiter_bytes(CHUNK_BYTES):
+                            chunk = chunk[:ASSET_MAX_BYTES - total]
+                            if scan is None: scan = self._text_scanner(chunk, ctype, scanner)
+                            sha.update(chunk)
+                            tmp.write(chunk)
+                            if scan: scan(chunk)
+                            total += len(chunk)
+                            if total >= ASSET_MAX_BYTES:
+                                METRICS.inc("assets", result="truncated")
+                                break
+            digest = sha.hexdigest()
+            path = os.path.join(self.store_dir, digest[:2], digest)
+            if os.path.exists(path):
+                METRICS.inc("assets", result="dedup")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                tmp_path = None
+        finally:
+            if tmp_path and os.path.exists(tmp_path): os.remove(tmp_path)
+
+        if zipfile.is_zipfile(path):
+            self._scan_docx(path, scanner)
+        scanner.feed(b"", final=True)
+        verified = is_verified(scanner.found, needles)
+        METRICS.inc("assets", result="verified" if verified else "unverified")
+        return {"url": url, "sha256": digest, "bytes": total, "type": ctype.split(";")[0],
+                "matched": sorted(scanner.found), "verified": verified}
+
+    @staticmethod
+    def _text_scanner(head: bytes, ctype: str, scanner: NeedleScanner):
+        """
+        Picks how the download's text reaches the scanner from its first bytes.
+        PDF object syntax (offsets, /Length) is never searched, only inflated
+        streams; a DOCX is scanned from its XML once complete (returns False).
+        """
+        if head.startswith(b"%PDF") or "pdf" in ctype: return PdfInflater(scanner.feed).feed
+        if head.startswith(b"PK\x03\x04"): return False
+        return scanner.feed   # Legacy .doc keeps its text as plain (often UTF-16) bytes
+
+    @staticmethod
+    def _scan_docx(path: str, scanner: NeedleScanner):
+        """DOCX is a zip; stream the XML parts' text through the scanner entry by entry."""
+        with zipfile.ZipFile(path) as z:
+            for info in z.infolist():
+                if not info.filename.startswith("word/") or not info.filename.endswith(".xml"): continue
+                text = XmlText(scanner.feed)
+                with z.open(info) as f:
+                    for chunk in iter(lambda: f.read(CHUNK_BYTES), b""): text.feed(chunk)
+                scanner.feed(b" ")   # Parts do not run into each other
+
+# --- SHARED INSTANCE ---
+# The HTTP pool and semaphore belong to the loop that created them (see llm_client)
+_VERIFIERS = weakref.WeakKeyDictionary()
+
+def get_asset_verifier() -> AssetVerifier:
+    loop = asyncio.get_running_loop()
+    if loop not in _VERIFIERS: _VERIFIERS[loop] = AssetVerifier()
+    return _VERIFIERS[loop]
+
+async def verify_assets(name: str, profile: dict) -> List[dict]:
+    """
+    Checks the profile's documents; returns the verified ones. Certificate
+    images are not downloaded: their text is in pixels, which is not read.
+    """
+    assets = profile.get("assets") or {}
+    urls = list(dict.fromkeys(assets.get("documents") or []))[:ASSET_PER_PROFILE]
+    needles = build_needles(name, profile)
+    if not urls or not needles: return []
+    verifier = get_asset_verifier()
+    results = await asyncio.gather(*(verifier.check(u, needles) for u in urls))
+    return [{k: r[k] for k in ("url", "sha256", "matched")} for r in results if r and r["verified"]]
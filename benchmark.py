@@ -0,0 +1,514 @@
+"""
+Offline benchmark for the refinery pipeline.
+
+    python benchmark.py seed                      # build bench_corpus/ from the sample data
+    python benchmark.py run --llm-latency 0.3 --scale 5 --json bench.json
+
+Search results and HTML pages are replayed from a recorded corpus, linked
+CV PDFs are generated on the fly and the LLM is a local stub
+OpenAI-compatible server, so a run needs no network, browser or model. Each scenario (process_doctor, hunt_text and the full
+RefineryPipeline.run) reports doctors/min, p50/p95 per-doctor latency,
+peak traced memory and the number of LLM calls.
+
+Corpus layout (one JSON object per line, so real recordings can be dropped in):
+    search.jsonl   {"query": ..., "results": [{"title", "href", "body"}]}
+    pages.jsonl    {"url": ..., "html": ..., "blocked": bool}
+    records.jsonl  {"name": ..., "profile": {...}}   # what the stub LLM knows
+"""
+import argparse
+import ast
+import asyncio
+import contextlib
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import asset_verifier
+import cache_store
+import domain_stats
+import llm_client
+import search_client
+from cache_store import normalize_url
+from enrichment_agent import EnrichmentAgent, FIELD_QUERIES
+from fetch_service import FetchService
+from metrics import METRICS
+from pipeline_controller import RefineryPipeline, ENRICH_WORKERS
+from progress import FINAL_STATUSES
+from scraper_helper import HostLimiter
+from search_scraper import process_doctor, INPUT_FILE, BATCH_SIZE, PER_HOST_LIMIT
+
+# --- CONFIGURATION ---
+CORPUS_DIR = "bench_corpus"
+RECORDS_FILE = "final_enriched_v2.json"
+PAGE_KB = 60              # Seeded pages are padded to roughly this size
+BLOCKED_EVERY = 4         # Every Nth doctor's hospital page blocks the standard crawler
+LLM_LATENCY = 0.2         # Seconds the stub LLM sleeps per request
+FETCH_LATENCY = 0.05      # Standard crawler replay delay
+STEALTH_LATENCY = 0.4     # Nodriver replay delay
+SEARCH_LATENCY = 0.02
+SCENARIOS = ("process_doctor", "hunt_text", "pipeline")
+
+# Copies made by --scale carry " #k" after the name; the copy number is moved
+# into a query parameter so every copy fetches (and caches) its own pages.
+COPY_MARK = re.compile(r"\s#(\d+)\b")
+COPY_PARAM = "bench_copy"
+
+def split_copy(text: str):
+    m = COPY_MARK.search(text)
+    return COPY_MARK.sub("", text), (m.group(1) if m else None)
+
+def copy_line(line: str, k: int) -> str:
+    name, sep, rest = line.partition(",")
+    return f"{name} #{k}{sep}{rest}"
+
+def strip_copy_param(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != COPY_PARAM]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def add_copy_param(url: str, copy: Optional[str]) -> str:
+    if not copy: return url
+    return url + ("&" if "?" in url else "?") + f"{COPY_PARAM}={copy}"
+
+# --- CORPUS ---
+class Corpus:
+    def __init__(self, path: str = CORPUS_DIR):
+        self.path = os.path.abspath(path)
+        self.search = {search_client.normalize_query(r["query"]): r["results"] for r in self._read("search.jsonl")}
+        self.pages = {normalize_url(r["url"]): r for r in self._read("pages.jsonl")}
+        self.records = {r["name"].lower(): r["profile"] for r in self._read("records.jsonl")}
+
+    def _read(self, name: str) -> List[dict]:
+        with open(os.path.join(self.path, name), encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def results_for(self, query: str) -> List[dict]:
+        base, copy = split_copy(query)
+        results = self.search.get(search_client.normalize_query(base), [])
+        return [{**r, "href": add_copy_param(r["href"], copy)} for r in results]
+
+    def page(self, url: str) -> Optional[dict]:
+        return self.pages.get(normalize_url(strip_copy_param(url)))
+
+def make_npi(seed: str) -> str:
+    """Deterministic NPI that passes the CMS check digit."""
+    body = str(100000000 + zlib.crc32(seed.encode()) % 900000000)[:9]
+    total = 0
+    for i, ch in enumerate(reversed("80840" + body)):
+        d = int(ch) * (2 if i % 2 == 0 else 1)
+        total += d - 9 if d > 9 else d
+    return body + str((10 - total % 10) % 10)
+
+def _padding(kb: int, seed: str) -> str:
+    """Boilerplate the parser has to wade through: scripts, nav, and filler copy."""
+    chunk = (f"<script>window.__STATE__={{\"k\":\"{seed}\",\"v\":[1,2,3,4,5,6,7,8]}};</script>"
+             "<nav><a href='/'>Home</a> <a href='/find'>Find a Doctor</a> <a href='/locations'>Locations</a></nav>"
+             "<p>Our care teams offer same-week appointments, telehealth visits and accept most major "
+             "insurance plans. Parking is available on site.</p>")
+    return chunk * max(1, kb * 1024 // len(chunk))
+
+def _page(title: str, body: str, kb: int) -> str:
+    return (f"<html><head><title>{title}</title><style>body{{font:14px sans-serif}}</style></head>"
+            f"<body>{_padding(kb // 2, title)}<main>{body}</main>{_padding(kb // 2, title[::-1])}"
+            f"<footer>© Medical Directory</footer></body></html>")
+
+def seed_corpus(out_dir: str = CORPUS_DIR, names_file: str = INPUT_FILE,
+                records_file: str = RECORDS_FILE, page_kb: int = PAGE_KB) -> Corpus:
+    """
+    Builds a synthetic corpus from the names list and the enriched sample:
+    per doctor a mismatching directory hit, a hospital profile page (LLM
+    path, sometimes blocked), an npidb page for every third doctor (rules
+    fast path) and, for the enrichment hunt, registry/board pages plus
+    filler results shared between doctors.
+    """
+    with open(names_file, encoding="utf-8") as f:
+        lines = [l.strip() for l in f if l.strip()]
+    samples = []
+    if os.path.exists(records_file):
+        with open(records_file, encoding="utf-8") as f: samples = json.load(f)
+
+    search, pages, records = [], {}, []
+    names = [l.split(",")[0].strip() for l in lines]
+    shared = [f"https://www.healthblog.example/top-doctors-{k}" for k in range(3)]
+    for url in shared:
+        pages[url] = {"url": url, "html": _page("Top doctors", "<h1>Top doctors this year</h1>" +
+                      "".join(f"<p>{n} was recognised by patients.</p>" for n in names), page_kb)}
+
+    for i, (line, name) in enumerate(zip(lines, names)):
+        fields = {}
+        if i < len(samples):
+            for fld in samples[i]["validation_result"]["fields"]:
+                if fld["final_value"] and fld["final_value"] != "N/A": fields[fld["field"]] = fld["final_value"]
+        slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+        npi = make_npi(slug)
+        license_id = f"MD{100000 + zlib.crc32(slug.encode()) % 900000}"
+        phone = fields.get("phone", "(555) 010-%04d" % i)
+        address = fields.get("address", f"{100 + i} Main Street, Springfield, IL 62701")
+        speciality = line.split(",")[1].strip() if "," in line else "Internal Medicine"
+        other = names[(i + 1) % len(names)]
+        records.append({"name": name, "profile": {
+            "name": name, "npi_id": npi, "license_id": license_id, "speciality": speciality,
+            "email": fields.get("email", "N/A"), "phone_no": phone, "address": address,
+            "hospital_affiliation": "General Hospital", "education": "MBBS, MD",
+            "years_experience": str(10 + i % 20), "languages": ["English"],
+            "summary": f"{name} is a {speciality} specialist.",
+        }})
+
+        directory = f"https://www.docdirectory.example/listing/{slug}"
+        hospital = f"https://hospital-{i % 5}.example/doctors/{slug}"
+        npidb = f"https://npidb.org/doctors/{slug}"
+        registry = f"https://npiregistry.cms.hhs.gov/provider-view/{npi}"
+        board = f"https://medicalboard.example.gov/license/{slug}"
+        pages[directory] = {"url": directory, "html": _page(other, (
+            f"<h1>{other}</h1><p>{other} practises {speciality}. Phone: (555) 020-{i:04d}</p>"), page_kb)}
+        pages[hospital] = {"url": hospital, "blocked": i % BLOCKED_EVERY == 0, "html": _page(name, (
+            f"<h1>{name}</h1><p>{name} is a {speciality} at General Hospital with {10 + i % 20} years "
+            f"of experience.</p><p>Call <a href='tel:{phone}'>{phone}</a></p><address>{address}</address>"
+            f"<a href='/files/{slug}-cv.pdf'>Download CV</a>"), page_kb)}
+        pages[npidb] = {"url": npidb, "html": _page(name, (
+            f"<h1>{name}</h1><p>NPI Number: <span itemprop='identifier'>{npi}</span></p>"
+            f"<p>Phone: {phone}</p><address>{100 + i} Oak Avenue, Suite 2, Springfield, IL 62701</address>"), page_kb)}
+        pages[registry] = {"url": registry, "html": _page(name, (
+            f"<h1>{name}</h1><table><tr><td>NPI</td><td class='npi'>{npi}</td></tr></table>"), page_kb)}
+        pages[board] = {"url": board, "html": _page(name, (
+            f"<h1>License lookup</h1><p>{name}. State Medical License Number: {license_id}. Status: Active.</p>"), page_kb)}
+
+        hits = [directory, hospital] + ([npidb] if i % 3 == 0 else [])
+        search.append({"query": f"{line} profile", "results": [
+            {"title": url, "href": url, "body": ""} for url in hits]})
+        hunts = {"npi_id": [shared[i % 3], directory, registry, hospital],
+                 "license_id": [shared[(i + 1) % 3], hospital, board, directory]}
+        for field, urls in hunts.items():
+            search.append({"query": FIELD_QUERIES[field].format(name=name), "results": [
+                {"title": url, "href": url, "body": ""} for url in urls]})
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, rows in (("search.jsonl", search), ("pages.jsonl", pages.values()), ("records.jsonl", records)):
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+            for row in rows: f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return Corpus(out_dir)
+
+# --- REPLAY FETCHERS ---
+class ReplaySearchClient:
+    """Stands in for search_client.SearchClient."""
+    def __init__(self, corpus: Corpus, latency: float = SEARCH_LATENCY):
+        self.corpus = corpus
+        self.latency = latency
+
+    async def text(self, query: str, max_results: int = 3) -> List[dict]:
+        await asyncio.sleep(self.latency)
+        return self.corpus.results_for(query)[:max_results]
+
+class ReplayCrawler:
+    """Stands in for crawl4ai's AsyncWebCrawler; blocked pages come back as junk."""
+    def __init__(self, corpus: Corpus, latency: float = FETCH_LATENCY):
+        self.corpus = corpus
+        self.latency = latency
+
+    async def __aenter__(self): return self
+    async def __aexit__(self, *exc): return False
+
+    async def arun(self, url: str, config=None):
+        if url.startswith("raw:"): return SimpleNamespace(success=True, html=url[4:])
+        await asyncio.sleep(self.latency)
+        page = self.corpus.page(url)
+        if not page or page.get("blocked"):
+            return SimpleNamespace(success=page is not None, html="<html>Access denied</html>")
+        return SimpleNamespace(success=True, html=page["html"])
+
+class ReplayStealth:
+    """Stands in for scraper_helper.StealthBrowser."""
+    def __init__(self, corpus: Corpus, latency: float = STEALTH_LATENCY):
+        self.corpus = corpus
+        self.latency = latency
+
+    async def start(self): pass
+    async def close(self): pass
+    async def healthy(self): return True
+
+    async def get_html(self, url: str, wait_time: float = 0, selector=None) -> Optional[str]:
+        await asyncio.sleep(self.latency)
+        page = self.corpus.page(url)
+        return page["html"] if page else None
+
+def _cv_pdf(slug: str) -> bytes:
+    """A small PDF whose FlateDecode content stream carries the doctor's name and NPI."""
+    text = f"(Curriculum Vitae: {slug.replace('-', ' ').title()}) Tj T* (NPI: {make_npi(slug)}) Tj"
+    content = zlib.compress(f"BT /F1 12 Tf 72 720 Td {text} ET".encode())
+    header = f"%PDF-1.4\n1 0 obj << /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode()
+    return header + content + b"\nendstream\nendobj\n%EOF\n"
+
+def replay_assets(latency: float = FETCH_LATENCY) -> httpx.AsyncBaseTransport:
+    """httpx transport for asset_verifier: seeded pages link /files/<slug>-cv.pdf."""
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        match = re.search(r"/files/([a-z0-9-]+)-cv\.pdf$", request.url.path)
+        if not match: return httpx.Response(404)
+        body = _cv_pdf(match.group(1))
+        headers = {"content-type": "application/pdf", "content-length": str(len(body))}
+        return httpx.Response(200, headers=headers, content=b"" if request.method == "HEAD" else body)
+    return httpx.MockTransport(handle)
+
+# --- STUB LLM ---
+class StubLLMServer:
+    """
+    OpenAI-compatible /v1/chat/completions and /v1/completions on localhost.
+    Answers from the corpus records, but only with values that actually occur
+    in the prompt's source text, so page choice still matters.
+    """
+    def __init__(self, records: Dict[str, dict], latency: float = LLM_LATENCY):
+        self.records = records
+        self.latency = latency
+        self.requests = 0
+        self.prompts = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                reply = stub.handle(self.path, body)
+                data = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args): pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-llm", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server: self._server.shutdown()
+
+    def reset(self):
+        with self._lock: self.requests = self.prompts = 0
+
+    def handle(self, path: str, body: dict) -> dict:
+        if path.endswith("/chat/completions"):
+            prompts = ["\n".join(m["content"] for m in body.get("messages", []))]
+        else:
+            prompts = body.get("prompt") or []
+            if isinstance(prompts, str): prompts = [prompts]
+        with self._lock:
+            self.requests += 1
+            self.prompts += len(prompts)
+        time.sleep(self.latency)
+        answers = [json.dumps(self.answer(p)) for p in prompts]
+        usage = {"prompt_tokens": sum(len(p) // 4 for p in prompts),
+                 "completion_tokens": sum(len(a) // 4 for a in answers)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        common = {"id": "stub", "created": int(time.time()), "model": body.get("model", "stub"), "usage": usage}
+        if path.endswith("/chat/completions"):
+            return {**common, "object": "chat.completion", "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": answers[0]}}]}
+        return {**common, "object": "text_completion", "choices": [
+            {"index": i, "text": a, "finish_reason": "stop"} for i, a in enumerate(answers)]}
+
+    def answer(self, prompt: str) -> dict:
+        m = re.search(r"Doctor '(.+?)' is missing these fields: (\[.*?\])", prompt)
+        if m:
+            query, wanted = m.group(1), ast.literal_eval(m.group(2))
+        else:
+            m = re.search(r"Extract doctor profile for: '(.+?)'", prompt)
+            query = m.group(1) if m else ""
+            wanted = re.findall(r"^- (\w+) \(", prompt, re.M) or ["name"]
+        text = re.split(r"(?:Source Text|Text):\n", prompt, maxsplit=1)[-1].lower()
+        # The page is about whichever known doctor it names, not necessarily the one asked for
+        subject = next((n for n in self.records if n in text), split_copy(query.split(",")[0])[0].lower())
+        profile = self.records.get(subject, {})
+        out = {}
+        for field in wanted:
+            value = profile.get(field)
+            if field == "name" and subject in text:
+                out[field] = value
+            elif isinstance(value, str) and value.lower() in text:
+                out[field] = value
+            else:
+                out[field] = "N/A"
+        return out
+
+# --- SCENARIOS ---
+@contextlib.contextmanager
+def isolated_state(workdir: str, stub: StubLLMServer):
+    """Fresh caches, domain stats, metrics and workflow DB inside `workdir`."""
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    cache_store._llm_cache = cache_store._page_cache = cache_store._search_cache = None
+    domain_stats._stats = None
+    METRICS.reset()
+    stub.reset()
+    try:
+        yield
+    finally:
+        cache_store._llm_cache = cache_store._page_cache = cache_store._search_cache = None
+        domain_stats._stats = None
+        os.chdir(cwd)
+
+def install_clients(corpus: Corpus, stub: StubLLMServer, opts):
+    """Registers replay/stub clients for the running loop (see get_search_client / get_llm_client / get_asset_verifier)."""
+    loop = asyncio.get_running_loop()
+    search_client._CLIENTS[loop] = ReplaySearchClient(corpus, opts.search_latency)
+    llm_client._CLIENTS[loop] = llm_client.LLMClient(base_url=stub.url, batch_size=opts.llm_batch)
+    asset_verifier._VERIFIERS[loop] = asset_verifier.AssetVerifier(transport=replay_assets(opts.fetch_latency))
+
+async def bench_process_doctor(lines, corpus, stub, opts) -> List[float]:
+    install_clients(corpus, stub, opts)
+    crawler, stealth = ReplayCrawler(corpus, opts.fetch_latency), ReplayStealth(corpus, opts.stealth_latency)
+    limiter = HostLimiter(PER_HOST_LIMIT)
+    sem = asyncio.Semaphore(opts.workers)
+    latencies = []
+
+    async def one(i, line):
+        async with sem:
+            started = time.perf_counter()
+            await process_doctor(line, i + 1, len(lines), crawler, stealth, limiter)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i, l) for i, l in enumerate(lines)))
+    return latencies
+
+async def bench_hunt_text(lines, corpus, stub, opts) -> List[float]:
+    install_clients(corpus, stub, opts)
+    crawler, stealth = ReplayCrawler(corpus, opts.fetch_latency), ReplayStealth(corpus, opts.stealth_latency)
+    agent = EnrichmentAgent()
+    sem = asyncio.Semaphore(opts.enrich_workers)
+    latencies = []
+
+    async def one(line):
+        async with sem:
+            started = time.perf_counter()
+            await agent.hunt_text(line, ["npi_id", "license_id"], crawler, stealth)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(l) for l in lines))
+    return latencies
+
+async def bench_pipeline(lines, corpus, stub, opts) -> List[float]:
+    """Per-doctor latency is first event to final status."""
+    install_clients(corpus, stub, opts)
+    fetchers = FetchService(lambda: ReplayCrawler(corpus, opts.fetch_latency),
+                            lambda: ReplayStealth(corpus, opts.stealth_latency))
+    pipeline = RefineryPipeline(workers=opts.workers, enrich_workers=opts.enrich_workers, db_path="workflow.db",
+                                fetch_service=fetchers)
+    first_seen, latencies = {}, []
+    async for event in pipeline.run(lines):
+        if event.kind != "doctor": continue
+        first_seen.setdefault(event.doctor, event.ts)
+        if event.status in FINAL_STATUSES:
+            latencies.append(event.ts - first_seen[event.doctor])
+    return latencies
+
+BENCHES = {"process_doctor": bench_process_doctor, "hunt_text": bench_hunt_text, "pipeline": bench_pipeline}
+
+def percentile(values: List[float], q: float) -> float:
+    if not values: return 0.0
+    if len(values) == 1: return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[round(q * 100) - 1]
+
+def run_scenario(scenario: str, lines, corpus, stub, opts) -> dict:
+    with tempfile.TemporaryDirectory(prefix=f"bench-{scenario}-") as workdir, \
+            isolated_state(workdir, stub), open(os.devnull, "w") as devnull:
+        tracemalloc.start()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if opts.verbose else devnull):
+            latencies = asyncio.run(BENCHES[scenario](lines, corpus, stub, opts))
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            "scenario": scenario,
+            "doctors": len(latencies),
+            "seconds": round(elapsed, 2),
+            "doctors_per_min": round(len(latencies) / elapsed * 60, 1) if elapsed else 0.0,
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "peak_mem_mb": round(peak / 2**20, 1),
+            "llm_requests": stub.requests,
+            "llm_prompts": stub.prompts,
+            "llm_tokens": int(METRICS.counter_value("llm_tokens")),
+            "stealth_fallbacks": int(METRICS.counter_value("fallbacks", kind="stealth")),
+        }
+
+def print_report(results: List[dict]):
+    cols = ["scenario", "doctors", "seconds", "doctors_per_min", "p50", "p95", "peak_mem_mb", "llm_requests", "llm_tokens"]
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark with replayed pages and a stub LLM.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_seed = sub.add_parser("seed", help="build a synthetic corpus from the sample names and records")
+    p_seed.add_argument("--out", default=CORPUS_DIR)
+    p_seed.add_argument("--names", default=INPUT_FILE)
+    p_seed.add_argument("--records", default=RECORDS_FILE)
+    p_seed.add_argument("--page-kb", type=int, default=PAGE_KB)
+
+    p_run = sub.add_parser("run", help="replay the corpus through each scenario")
+    p_run.add_argument("--corpus", default=CORPUS_DIR)
+    p_run.add_argument("--names", default=INPUT_FILE)
+    p_run.add_argument("--scenario", choices=SCENARIOS, action="append", help="repeatable; default: all")
+    p_run.add_argument("--scale", type=int, default=1, help="replay each name this many times as distinct doctors")
+    p_run.add_argument("--workers", type=int, default=BATCH_SIZE)
+    p_run.add_argument("--enrich-workers", type=int, default=ENRICH_WORKERS)
+    p_run.add_argument("--llm-latency", type=float, default=LLM_LATENCY)
+    p_run.add_argument("--llm-batch", type=int, default=llm_client.LLM_BATCH_SIZE)
+    p_run.add_argument("--fetch-latency", type=float, default=FETCH_LATENCY)
+    p_run.add_argument("--stealth-latency", type=float, default=STEALTH_LATENCY)
+    p_run.add_argument("--search-latency", type=float, default=SEARCH_LATENCY)
+    p_run.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    p_run.add_argument("--verbose", action="store_true", help="keep the scrapers' console output")
+
+    args = parser.parse_args(argv)
+    if args.command == "seed":
+        corpus = seed_corpus(args.out, args.names, args.records, args.page_kb)
+        print(f"Seeded {len(corpus.records)} doctors, {len(corpus.pages)} pages, "
+              f"{len(corpus.search)} searches into {corpus.path}")
+        return
+
+    if not os.path.isdir(args.corpus):
+        sys.exit(f"No corpus at {args.corpus}; run `python benchmark.py seed` first.")
+    corpus = Corpus(args.corpus)
+    with open(args.names, encoding="utf-8") as f:
+        base = [l.strip() for l in f if l.strip()]
+    lines = [l if k == 0 else copy_line(l, k) for k in range(args.scale) for l in base]
+
+    stub = StubLLMServer(corpus.records, args.llm_latency).start()
+    try:
+        results = [run_scenario(s, lines, corpus, stub, args) for s in (args.scenario or SCENARIOS)]
+    finally:
+        stub.stop()
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+LLM_CACHE_PATH = "llm_cache.db"
+LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PAGE_CACHE_PATH = "page_cache.db"
+PAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+PAGE_TTL_DEFAULT = 6 * 3600
+# Directory / registry pages change rarely; match on host suffix
+DOMAIN_TTLS = {
+    "npidb.org": 7 * 86400,
+    "npiregistry.cms.hhs.gov": 7 * 86400,
+    "health.usnews.com": 3 * 86400,
+    ".gov": 86400,
+}
+SEARCH_CACHE_PATH = "search_cache.db"
+SEARCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SEARCH_TTL = 3 * 86400
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "msclkid")
+
+def content_key(*parts) -> str:
+    """Stable SHA-256 over any JSON-serialisable parts (text, versions, field lists)."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def normalize_url(url: str) -> str:
+    """Canonical form used as the page cache key: no fragment, tracking params or default ports."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+def page_ttl(url: str) -> int:
+    host = (urlsplit(url).hostname or "").lower()
+    for suffix, ttl in DOMAIN_TTLS.items():
+        if host == suffix.lstrip(".") or host.endswith(suffix if suffix.startswith(".") else "." + suffix):
+            return ttl
+    return PAGE_TTL_DEFAULT
+
+class DiskCache:
+    """
+    Small persistent key/value store on SQLite.
+    Values are JSON (zlib-compressed when `compress` is set); entries may
+    carry a TTL, and once the stored bytes exceed `max_bytes` the least
+    recently used entries are evicted. Safe to share between threads.
+    """
+    def __init__(self, path: str, max_bytes: int, compress: bool = False):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL, expires_at REAL)"
+        )
+        cols = [r[1] for r in self.conn.execute("PRAGMA table_info(entries)")]
+        if "expires_at" not in cols:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expiry ON entries(expires_at)")
+        self.conn.commit()
+        self._bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            now = time.time()
+            row = self.conn.execute("SELECT value, size, expires_at FROM entries WHERE key=?", (key,)).fetchone()
+            if row is not None and row[2] is not None and row[2] < now:
+                self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                self._bytes -= row[1]
+                row = None
+            if row is None:
+                self.conn.commit()
+                self.misses += 1
+                METRICS.inc("cache_lookups", cache=self.name, result="miss")
+                return None
+            self.hits += 1
+            METRICS.inc("cache_lookups", cache=self.name, result="hit")
+            self.conn.execute("UPDATE entries SET last_access=? WHERE key=?", (now, key))
+            self.conn.commit()
+        blob = zlib.decompress(row[0]) if self.compress else row[0]
+        return json.loads(blob)
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None):
+        blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if self.compress: blob = zlib.compress(blob, 6)
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            old = self.conn.execute("SELECT size FROM entries WHERE key=?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), time.time(), expires_at)
+            )
+            self._bytes += len(blob) - (old[0] if old else 0)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        expired = self.conn.execute(
+            "SELECT key, size FROM entries WHERE expires_at < ?", (time.time(),)
+        ).fetchall()
+        for key, size in expired:
+            self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            self._bytes -= size
+        while self._bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows: break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                self._bytes -= size
+                if self._bytes <= self.max_bytes: break
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self._bytes}
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+            self._bytes = 0
+
+# --- SHARED INSTANCES ---
+_llm_cache: Optional[DiskCache] = None
+_page_cache: Optional[DiskCache] = None
+_search_cache: Optional[DiskCache] = None
+
+def get_llm_cache() -> DiskCache:
+    global _llm_cache
+    if _llm_cache is None: _llm_cache = DiskCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES)
+    return _llm_cache
+
+def get_page_cache() -> DiskCache:
+    global _page_cache
+    if _page_cache is None: _page_cache = DiskCache(PAGE_CACHE_PATH, PAGE_CACHE_MAX_BYTES, compress=True)
+    return _page_cache
+
+def get_search_cache() -> DiskCache:
+    global _search_cache
+    if _search_cache is None: _search_cache = DiskCache(SEARCH_CACHE_PATH, SEARCH_CACHE_MAX_BYTES)
+    return _search_cache
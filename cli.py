@@ -0,0 +1,234 @@
+"""
+Headless entry point for the refinery pipeline (no Streamlit).
+
+    python cli.py run doctor_names.txt --shard 0/4 --workers 8
+    cat names.txt | python cli.py run -
+    tail -f queue.txt | python cli.py worker --batch 50 --idle 10
+    python cli.py rescore --dry-run
+    python cli.py export final_enriched.jsonl --incremental
+
+Progress is written to stdout as JSON lines; the scrapers' own console
+output goes to stderr. Every process writes to the same workflow DB.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import signal
+import sys
+import threading
+import time
+import zlib
+from typing import Optional
+from pipeline_controller import RefineryPipeline, ENRICH_WORKERS
+from fetch_service import get_fetch_service, close_fetch_service
+from search_scraper import BATCH_SIZE, PER_HOST_LIMIT
+from workflow_db import WorkflowDB, DB_PATH
+from confidence_scorer import VERIFY_THRESHOLD
+
+# --- INPUT ---
+def parse_shard(value: str):
+    try:
+        i, n = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected i/N, e.g. 0/4")
+    if not 0 <= i < n: raise argparse.ArgumentTypeError("shard index must be in [0, N)")
+    return i, n
+
+def in_shard(name: str, shard) -> bool:
+    """Stable across machines and runs: hashes the whitespace/case-normalised line."""
+    if not shard: return True
+    i, n = shard
+    return zlib.crc32(" ".join(name.lower().split()).encode("utf-8")) % n == i
+
+def read_names(path: str, shard):
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, encoding="utf-8") as f: lines = f.readlines()
+    return [n.strip() for n in lines if n.strip() and in_shard(n.strip(), shard)]
+
+# --- OUTPUT ---
+class JsonlEmitter:
+    def __init__(self, stream, shard):
+        self.stream = stream
+        self.shard = f"{shard[0]}/{shard[1]}" if shard else None
+
+    def emit(self, kind: str, **fields):
+        record = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "type": kind, **fields}
+        if self.shard: record["shard"] = self.shard
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def event(self, event):
+        fields = event.to_dict()
+        del fields["kind"], fields["ts"]
+        self.emit(event.kind, **fields)
+
+# --- COMMANDS ---
+def make_pipeline(args, fetch_service=None) -> RefineryPipeline:
+    return RefineryPipeline(workers=args.workers, per_host=args.per_host, fetch_service=fetch_service,
+                            enrich_workers=args.enrich_workers, db_path=args.db,
+                            prometheus_path=args.prometheus,
+                            enrich_fetch_budget=args.enrich_fetch_budget,
+                            enrich_time_budget=args.enrich_time_budget,
+                            reuse_stored=not args.no_reuse, check_assets=not args.no_assets)
+
+def install_stop(pipeline: RefineryPipeline, stopped: Optional[asyncio.Event] = None):
+    """SIGINT/SIGTERM stop the current run and, if given, set `stopped`."""
+    loop = asyncio.get_running_loop()
+    def stop():
+        pipeline.stop()
+        if stopped: stopped.set()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except NotImplementedError:
+            pass # Windows: Ctrl+C falls back to KeyboardInterrupt
+
+async def run_batch(pipeline, names, out: JsonlEmitter, resume: bool):
+    out.emit("batch_start", size=len(names))
+    started = time.time()
+    async for event in pipeline.run(names, resume=resume):
+        out.event(event)
+    out.emit("batch_end", size=len(names), seconds=round(time.time() - started, 1))
+
+async def cmd_run(args, out: JsonlEmitter):
+    names = read_names(args.input, args.shard)
+    pipeline = make_pipeline(args)
+    install_stop(pipeline)
+    if not names:
+        out.emit("log", message="No names in this shard.")
+        return
+    try:
+        await run_batch(pipeline, names, out, args.resume)
+    finally:
+        pipeline.db.close()
+
+async def cmd_worker(args, out: JsonlEmitter):
+    """
+    Long-running mode: batches names from stdin as they arrive until EOF or
+    a signal. Batches share one warm crawler/browser (see fetch_service).
+    """
+    pipeline = make_pipeline(args, get_fetch_service())
+    stopped = asyncio.Event()
+    install_stop(pipeline, stopped)
+    try:
+        await _worker_loop(pipeline, args, out, stopped)
+    finally:
+        await close_fetch_service()
+        pipeline.db.close()
+
+async def _worker_loop(pipeline, args, out: JsonlEmitter, stopped: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+
+    def reader():
+        for line in sys.stdin: loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+    threading.Thread(target=reader, daemon=True).start()
+
+    # An idle worker waits on stdin and the stop event together, so a signal
+    # ends it at once; a pending read is kept across batches so no line is lost
+    halt = asyncio.ensure_future(stopped.wait())
+    getter = None
+    eof = False
+    try:
+        while not eof and not stopped.is_set():
+            batch = []
+            deadline = None
+            while len(batch) < args.batch:
+                timeout = None if deadline is None else max(0, deadline - loop.time())
+                getter = getter or asyncio.ensure_future(lines.get())
+                await asyncio.wait({getter, halt}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done(): break # Batch window elapsed, or stopped
+                line, getter = getter.result(), None
+                if line is None:
+                    eof = True
+                    break
+                name = line.strip()
+                if name and in_shard(name, args.shard):
+                    batch.append(name)
+                    if deadline is None: deadline = loop.time() + args.idle
+            if batch and not stopped.is_set():
+                await run_batch(pipeline, batch, out, resume=True)
+    finally:
+        for t in (halt, getter):
+            if t: t.cancel()
+    out.emit("worker_exit", reason="eof" if eof else "stopped")
+
+def cmd_rescore(args, out: JsonlEmitter):
+    """Re-classifies stored records with the current ConfidenceScorer; no fetching."""
+    from rescore import rescore_db, rescore_jsonl
+    if args.jsonl:
+        if not args.out: sys.exit("--jsonl needs --out for the changed records")
+        try:
+            result = rescore_jsonl(args.jsonl, args.out, threshold=args.threshold)
+        except ValueError as e:
+            sys.exit(str(e))
+    else:
+        result = rescore_db(WorkflowDB(args.db), threshold=args.threshold, dry_run=args.dry_run)
+    out.emit("rescore", **result)
+
+def cmd_export(args, out: JsonlEmitter):
+    """Streams stored records to JSONL/Parquet in the final_enriched_v2 schema."""
+    from exporter import export_records, EXPORT_STATUSES
+    result = export_records(WorkflowDB(args.db), args.output, fmt=args.format, incremental=args.incremental,
+                            watermark=args.watermark, statuses=tuple(args.status or EXPORT_STATUSES))
+    out.emit("export", **result)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the doctor refinery pipeline without the dashboard.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--shard", type=parse_shard, help="only process shard i of N (i/N)")
+        p.add_argument("--workers", type=int, default=BATCH_SIZE, help="doctors discovered concurrently")
+        p.add_argument("--enrich-workers", type=int, default=ENRICH_WORKERS, help="doctors enriched concurrently")
+        p.add_argument("--per-host", type=int, default=PER_HOST_LIMIT, help="concurrent fetches per host")
+        p.add_argument("--db", default=DB_PATH, help="shared workflow DB path")
+        p.add_argument("--enrich-fetch-budget", type=int, help="max enrichment fetches per run")
+        p.add_argument("--enrich-time-budget", type=float, help="seconds of enrichment per run")
+        p.add_argument("--no-reuse", action="store_true",
+                       help="scrape every name even if the DB already has it verified")
+        p.add_argument("--no-assets", action="store_true",
+                       help="skip downloading linked documents to verify them")
+        p.add_argument("--prometheus", metavar="FILE", help="also write each run profile in Prometheus text format")
+
+    p_run = sub.add_parser("run", help="process a file (or - for stdin) once")
+    p_run.add_argument("input", help="names file, one doctor per line, or - for stdin")
+    p_run.add_argument("--resume", action="store_true", help="skip doctors already finished in the DB")
+    common(p_run)
+
+    p_worker = sub.add_parser("worker", help="keep reading names from stdin and process them in batches")
+    p_worker.add_argument("--batch", type=int, default=50, help="max names per pipeline run")
+    p_worker.add_argument("--idle", type=float, default=10, help="seconds to wait for a batch to fill")
+    common(p_worker)
+
+    p_rescore = sub.add_parser("rescore", help="re-score stored records after a scorer change (no fetching)")
+    p_rescore.add_argument("--db", default=DB_PATH, help="workflow DB to update in place")
+    p_rescore.add_argument("--jsonl", help="re-score this JSONL dump of {name, status, profile} records instead")
+    p_rescore.add_argument("--out", help="with --jsonl: where to write the records whose status changed")
+    p_rescore.add_argument("--threshold", type=float, default=VERIFY_THRESHOLD)
+    p_rescore.add_argument("--dry-run", action="store_true", help="report transitions without writing")
+
+    p_export = sub.add_parser("export", help="write stored records in the final_enriched_v2 schema")
+    p_export.add_argument("output", help="file to write; .parquet selects Parquet (needs pyarrow), else JSONL")
+    p_export.add_argument("--db", default=DB_PATH, help="workflow DB to read")
+    p_export.add_argument("--format", choices=("jsonl", "parquet"), help="override the format implied by the name")
+    p_export.add_argument("--incremental", action="store_true",
+                          help="only records changed since the last export under --watermark")
+    p_export.add_argument("--watermark", default="default", help="name of the incremental export stream")
+    p_export.add_argument("--status", nargs="+", help="statuses to include (default: Verified Enriched Manual_Review)")
+
+    args = parser.parse_args(argv)
+    if args.command in ("rescore", "export"):
+        (cmd_rescore if args.command == "rescore" else cmd_export)(args, JsonlEmitter(sys.stdout, None))
+        return
+    out = JsonlEmitter(sys.stdout, args.shard)
+    # Scraper prints would corrupt the JSONL stream; send them to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        asyncio.run(cmd_run(args, out) if args.command == "run" else cmd_worker(args, out))
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,21 @@
 import re
+import numpy as np
+import pandas as pd
+
+VERIFY_THRESHOLD = 0.8    # Score a record needs to count as Verified/Enriched
+DOCS_BONUS = 0.05         # Unverified documents on the source page
+# Profile fields an enrichment hunt can fill, and the weight each one unlocks
+HUNTABLE_FIELDS = {"npi_id": "npi", "license_id": "license"}
+
+def _as_text(values: pd.Series) -> pd.Series:
+    """
+    A column the way evaluate() reads it: str() of each value, '' for falsy
+    ones (None, NaN, 0, [], {}). Whole floats are ints upcast by missing
+    rows, so 1234567893 stays '1234567893' instead of '1234567893.0'.
+    """
+    if values.dtype.kind == "f" and (values.dropna() % 1 == 0).all():
+        values = values.astype("Int64")
+    return values.astype(object).map(lambda v: "" if v is None or v is pd.NA or v != v or not v else str(v))
 
 class ConfidenceScorer:
     def __init__(self):
@@ -9,6 +26,7 @@ class ConfidenceScorer:
             "contact": 0.15,
             "assets": 0.15
         }
+        self.trusted_sources = ['.gov', 'health.usnews', 'npidb']
 
     def evaluate(self, profile):
         """
@@ -30,8 +48,8 @@ class ConfidenceScorer:
             details['license'] = True
 
         # 3. Source Logic
-        url = profile.get('source_url', '').lower()
-        if any(x in url for x in ['.gov', 'health.usnews', 'npidb']):
+        url = str(profile.get('source_url') or '').lower()
+        if any(x in url for x in self.trusted_sources):
             score += self.weights['source']
             details['source_trust'] = True
 
@@ -39,7 +57,43 @@ class ConfidenceScorer:
         if profile.get('verified_assets'):
             score += self.weights['assets']
             details['assets_verified'] = True
-        elif profile.get('assets', {}).get('documents'):
-            score += 0.05 # Small bonus for just having unverified docs
+        elif (profile.get('assets') or {}).get('documents'):
+            score += DOCS_BONUS # Small bonus for just having unverified docs
 
         return round(min(score, 1.0), 2), details
+
+    def potential_gain(self, missing):
+        """
+        Most a hunt for `missing` fields can add to the score. Source trust
+        and assets come from the discovery page, so a hunt never changes them.
+        """
+        return round(sum(self.weights[HUNTABLE_FIELDS[f]] for f in missing if f in HUNTABLE_FIELDS), 2)
+
+    def evaluate_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Columnar evaluate() for many profiles at once. `df` holds one row per
+        profile with columns npi_id, npi, license_id, source_url (raw profile
+        values), verified_assets (bool) and documents (count). Returns score
+        plus one boolean column per details key, aligned with df.index; each
+        row matches evaluate() on the same profile.
+        """
+        def text(col):
+            return _as_text(df[col]) if col in df else pd.Series("", index=df.index)
+
+        npi = text("npi_id").where(text("npi_id") != "", text("npi"))
+        has_npi = npi.str.replace(r"\D", "", regex=True).str.len().to_numpy() == 10
+        license_id = text("license_id")
+        has_license = ((license_id != "") & (license_id != "N/A")).to_numpy()
+        pattern = "|".join(re.escape(x) for x in self.trusted_sources)
+        trusted = text("source_url").str.lower().str.contains(pattern, regex=True).to_numpy()
+        verified = df["verified_assets"].fillna(False).astype(bool).to_numpy()
+        has_docs = df["documents"].fillna(0).to_numpy() > 0
+
+        w = self.weights
+        score = (has_npi * w["npi"] + has_license * w["license"] + trusted * w["source"]
+                 + np.where(verified, w["assets"], np.where(has_docs, DOCS_BONUS, 0.0)))
+        return pd.DataFrame({
+            "score": np.minimum(score, 1.0).round(2),
+            "npi": has_npi, "license": has_license,
+            "source_trust": trusted, "assets_verified": verified,
+        }, index=df.index)
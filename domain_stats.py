@@ -0,0 +1,116 @@
+import json
+import os
+from collections import Counter
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+# --- CONFIGURATION ---
+DOMAIN_STATS_PATH = "domain_stats.json"
+MIN_SAMPLES = 5          # Fetches per tier before its history is trusted
+BLOCK_RATE_LIMIT = 0.8   # Standard tier blocked this often -> go straight to stealth
+PROBE_EVERY = 20         # Still probe a demoted standard tier / skipped domain every Nth time
+NO_MATCH_SKIP_AFTER = 8  # Pages from a domain without a single profile match
+
+TIERS = ("standard", "stealth")
+
+def domain_of(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+class DomainStats:
+    """
+    Per-domain fetch history, persisted across runs as JSON.
+    For each tier it tracks attempts, successes, blocks (fetched but junk)
+    and total latency. For each domain it tracks pages and profile matches.
+    smart_fetch uses it to pick tiers and process_doctor to skip dead domains.
+    """
+    def __init__(self, path: str = DOMAIN_STATS_PATH):
+        self.path = path
+        self.domains = {}
+        self.decisions = Counter()
+        if os.path.exists(path):
+            try:
+                with open(path) as f: self.domains = json.load(f)
+            except Exception as e:
+                print(f"   ⚠️  [Stats] Ignoring unreadable {path}: {e}")
+
+    def _entry(self, url: str) -> dict:
+        d = domain_of(url)
+        if d not in self.domains:
+            self.domains[d] = {
+                "pages": 0, "matches": 0,
+                **{t: {"attempts": 0, "ok": 0, "blocked": 0, "seconds": 0.0} for t in TIERS}
+            }
+        return self.domains[d]
+
+    # --- RECORDING ---
+    def record_fetch(self, url: str, tier: str, ok: bool, seconds: float, blocked: bool = False):
+        stats = self._entry(url)[tier]
+        stats["attempts"] += 1
+        stats["ok"] += int(ok)
+        stats["blocked"] += int(blocked)
+        stats["seconds"] += seconds
+
+    def record_outcome(self, url: str, matched: bool):
+        entry = self._entry(url)
+        entry["pages"] += 1
+        entry["matches"] += int(matched)
+
+    # --- ROUTING ---
+    def tiers_for(self, url: str) -> List[str]:
+        entry = self._entry(url)
+        std = entry["standard"]
+        if std["attempts"] >= MIN_SAMPLES and 1 - std["ok"] / std["attempts"] >= BLOCK_RATE_LIMIT:
+            skipped = entry.setdefault("standard_skipped", 0)
+            entry["standard_skipped"] = skipped + 1
+            if (skipped + 1) % PROBE_EVERY:
+                self.decisions["stealth_first"] += 1
+                return ["stealth"]
+            self.decisions["standard_probe"] += 1
+        else:
+            self.decisions["standard_first"] += 1
+        return list(TIERS)
+
+    def should_skip(self, url: str) -> bool:
+        entry = self._entry(url)
+        if entry["pages"] >= NO_MATCH_SKIP_AFTER and entry["matches"] == 0:
+            skipped = entry.setdefault("skipped", 0)
+            entry["skipped"] = skipped + 1
+            if (skipped + 1) % PROBE_EVERY:
+                self.decisions["skipped_domain"] += 1
+                return True
+            self.decisions["domain_probe"] += 1
+        return False
+
+    # --- REPORTING ---
+    def summary(self, url: str) -> dict:
+        entry = self._entry(url)
+        out = {"pages": entry["pages"], "matches": entry["matches"]}
+        for t in TIERS:
+            s = entry[t]
+            if s["attempts"]:
+                out[t] = {
+                    "success_rate": round(s["ok"] / s["attempts"], 2),
+                    "block_rate": round(s["blocked"] / s["attempts"], 2),
+                    "avg_seconds": round(s["seconds"] / s["attempts"], 2),
+                }
+        return out
+
+    def report(self, since: Optional[Counter] = None) -> str:
+        """Routing decisions, counted from the `since` snapshot of `decisions` if given."""
+        decisions = self.decisions - since if since else self.decisions
+        if not decisions: return "No routing decisions made."
+        return ", ".join(f"{k}={v}" for k, v in sorted(decisions.items()))
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f: json.dump(self.domains, f, indent=1)
+        os.replace(tmp, self.path)
+
+# --- SHARED INSTANCE ---
+_stats: Optional[DomainStats] = None
+
+def get_domain_stats() -> DomainStats:
+    global _stats
+    if _stats is None: _stats = DomainStats()
+    return _stats
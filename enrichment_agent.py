@@ -1,23 +1,61 @@
 import asyncio
-from ddgs import DDGS
-from openai import OpenAI
-from bs4 import BeautifulSoup
-from crawl4ai import CrawlerRunConfig, CacheMode
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+from search_scraper import smart_fetch
+from html_prep import prepare_page
+from field_extractor import extract_for, validate_field, NPI_DOMAINS
+from text_window import window_text, name_tokens, MISSING_TOKEN_BUDGET
+from search_client import get_search_client
+from llm_client import get_llm_client
+from cache_store import content_key, get_llm_cache
+from metrics import METRICS
 
-class EnrichmentAgent:
-    def __init__(self):
-        self.ddgs = DDGS()
-        self.llm_url = "http://localhost:8080/v1"
+MISSING_PROMPT_VERSION = 1  # Bump whenever the missing-fields prompt changes
+HUNT_RESULTS = 6            # Pages a full deep hunt may fetch across all fields
+FIELD_RESULTS = 4           # Search results tried per field
+
+# Targeted searches per field; anything else falls back to a generic profile query
+FIELD_QUERIES = {
+    "npi_id": "{name} NPI number npiregistry npidb",
+    "license_id": "{name} medical license number state medical board verification",
+}
+LICENSE_HINTS = ("medicalboard", "medboard", "board", "license", "licens", "verify")
+
+class HuntBudget:
+    """
+    Run-wide cap on enrichment work, shared by every hunt. The clock starts
+    at the first fetch so a long discovery phase does not eat into it.
+    None means unlimited.
+    """
+    def __init__(self, max_fetches: Optional[int] = None, seconds: Optional[float] = None):
+        self.fetches_left = max_fetches
+        self.seconds = seconds
+        self.deadline = None
+
+    def exhausted(self) -> bool:
+        if self.fetches_left is not None and self.fetches_left <= 0: return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def take(self) -> bool:
+        """Claims one fetch; False once the budget is spent."""
+        if self.deadline is None and self.seconds: self.deadline = time.monotonic() + self.seconds
+        if self.exhausted(): return False
+        if self.fetches_left is not None: self.fetches_left -= 1
+        return True
 
+class EnrichmentAgent:
     # --- HELPER: LLM EXTRACTION FOR MISSING FIELDS ---
-    async def extract_missing(self, html: str, name: str, missing: list) -> dict:
-        if not html: return {}
-        
-        soup = BeautifulSoup(html, 'html.parser')
-        for x in soup(["script", "style"]): x.decompose()
-        text = soup.get_text(separator=' ', strip=True)[:6000]
+    async def extract_missing(self, text: str, name: str, missing: list) -> dict:
+        """`text` is the cleaned page text from html_prep.prepare_page."""
+        if not text: return {}
+        text = window_text(text, name, MISSING_TOKEN_BUDGET, focus=missing)
+
+        cache = get_llm_cache()
+        key = content_key(text, "missing", MISSING_PROMPT_VERSION, name, sorted(missing))
+        cached = cache.get(key)
+        if cached is not None: return cached
 
-        client = OpenAI(base_url=self.llm_url, api_key="sk-none")
         prompt = (
             f"Context: Doctor '{name}' is missing these fields: {missing}.\n"
             f"Analyze the text below. Extract ONLY the missing fields.\n"
@@ -26,61 +64,111 @@ class EnrichmentAgent:
         )
         
         try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1
-            )
-            content = response.choices[0].message.content
-            # Clean JSON
-            if "```json" in content: content = content.split("```json")[1].split("```")[0]
-            elif "```" in content: content = content.split("```")[1].split("```")[0]
-            
-            data =  json.loads(content)
+            data = await get_llm_client().complete_json(prompt)
             # Filter out N/A
-            return {k: v for k, v in data.items() if v and v != "N/A"}
+            data = {k: v for k, v in data.items() if v and v != "N/A"}
+            cache.put(key, data)
+            return data
         except:
             return {}
 
     # --- MAIN HUNT FUNCTION ---
-    async def hunt_text(self, name, missing_fields, crawler, stealth_browser):
-        print(f"   🕵️ Deep Hunting for {name} (Missing: {missing_fields})")
-        found = {}
-        
-        # 1. Aggressive Search (6 results)
-        query = f"{name} {' '.join(missing_fields)} profile"
-        urls = []
+    async def hunt_text(self, name, missing_fields, crawler, stealth_browser,
+                        max_urls: int = HUNT_RESULTS, budget: Optional[HuntBudget] = None):
+        """
+        Hunts every missing field at once, each with its own targeted query.
+        `max_urls` caps the pages fetched for the whole record, and each fetch
+        is charged to `budget`. A field's hunt stops at its first validated value.
+        """
+        print(f"   🕵️ Deep Hunting for {name} (Missing: {missing_fields}, up to {max_urls} pages)")
+        hunt = _Hunt(name, missing_fields, max_urls)
+        await asyncio.gather(*(
+            self._hunt_field(hunt, field, crawler, stealth_browser, budget) for field in missing_fields
+        ))
+        METRICS.inc("enrich_records")
+        METRICS.inc("enrich_pages", hunt.fetched)
+        return hunt.found
+
+    async def _hunt_field(self, hunt: "_Hunt", field: str, crawler, stealth_browser, budget):
+        query = FIELD_QUERIES.get(field, "{name} {label} profile").format(
+            name=hunt.person, label=field.replace("_", " "))
         try:
-            results = list(self.ddgs.text(query, max_results=6))
-            urls = [r['href'] for r in results]
-        except: pass
-
-        # 2. Scrape Each
-        for url in urls:
-            if len(found) == len(missing_fields): break # Stop if full
-            
-            print(f"      🕷️ Checking: {url}")
-            html = ""
-            
-            # Try Standard
-            try:
-                conf = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, page_timeout=15000)
-                res = await crawler.arun(url=url, config=conf)
-                if res.success: html = res.html
-            except: pass
-            
-            # Try Stealth (Nodriver) if Standard failed
-            if not html:
-                print("      🛡️ Switching to Stealth...")
-                html = await stealth_browser.get_html(url)
-
-            # 3. LLM Extraction
-            if html:
-                new_data = await self.extract_missing(html, name, missing_fields)
-                if new_data:
-                    print(f"         ✅ Found: {new_data}")
-                    found.update(new_data)
-                    # Remove found fields from missing list so we don't look for them again
-                    missing_fields = [m for m in missing_fields if m not in found]
-
-        return found
+            with METRICS.timer("enrich_search", field=field):
+                results = await get_search_client().text(query, max_results=FIELD_RESULTS)
+        except Exception:
+            return
+        # Registry / board hosts first
+        results = sorted(results, key=lambda r: not is_source_for(field, r['href']))
+
+        for r in results:
+            if field in hunt.found: return
+            url = r['href']
+            # 1. The search snippet alone may already carry a validated value
+            snippet = f"{r.get('title', '')} {r.get('body', '')}"
+            if hunt.mentions(snippet): hunt.accept(extract_for(hunt.person, snippet, {}, url), url, "snippet")
+            if field in hunt.found: return
+            if url in hunt.seen: continue
+            hunt.seen.add(url)
+            if hunt.pages_left <= 0: return
+            if budget and not budget.take():
+                print("      ⏳ Enrichment budget spent, ending hunt")
+                METRICS.inc("budget_stops")
+                return
+            hunt.pages_left -= 1
+            hunt.fetched += 1
+
+            print(f"      🕷️ Checking ({field}): {url}")
+            # Page cache -> Standard -> Stealth (Nodriver), shared with Phase 1
+            html = await smart_fetch(url, crawler, stealth_browser)
+            if not html or field in hunt.found: continue
+            page = await prepare_page(html, url)
+            if not hunt.mentions(page.text):
+                METRICS.inc("enrich_pages_skipped", reason="name_absent")
+                continue
+
+            # 2. Rules first (any field); the LLM only for this hunt's field,
+            # the other fields have their own targeted pages
+            hunt.accept(extract_for(hunt.person, page.text, page.hints, url), url, "rules")
+            if field in hunt.found:
+                METRICS.inc("extraction", path="rules", stage="enrich")
+                continue
+            METRICS.inc("extraction", path="llm", stage="enrich")
+            hunt.accept(await self.extract_missing(page.text, hunt.person, [field]), url, "llm")
+
+class _Hunt:
+    """Shared state of one record's per-field hunts."""
+    def __init__(self, name: str, missing, max_urls: int):
+        self.person = name.split(",")[0].strip()   # Lines may carry ", Speciality"
+        self.tokens = name_tokens(self.person)
+        self.wanted = list(missing)
+        self.found = {}
+        self.seen = set()
+        self.pages_left = max_urls
+        self.fetched = 0
+
+    @property
+    def missing(self):
+        return [f for f in self.wanted if f not in self.found]
+
+    def mentions(self, text: str) -> bool:
+        """Cheap relevance check: every name token appears in the text."""
+        text = text.lower()
+        return bool(self.tokens) and all(t in text for t in self.tokens)
+
+    def accept(self, values: dict, url: str, source: str) -> bool:
+        """Keeps validated values for still-missing fields; True if any were new."""
+        new = {}
+        for field in self.missing:
+            value = validate_field(field, values.get(field))
+            if value: new[field] = value
+        if not new: return False
+        print(f"         ✅ Found ({source}): {new}")
+        self.found.update(new)
+        for field in new: METRICS.inc("enriched_fields", field=field, source=source)
+        return True
+
+def is_source_for(field: str, url: str) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    if field == "npi_id": return any(host == d or host.endswith("." + d) for d in NPI_DOMAINS)
+    if field == "license_id": return host.endswith(".gov") or any(k in url.lower() for k in LICENSE_HINTS)
+    return False
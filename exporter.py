@@ -0,0 +1,192 @@
+"""
+Streaming export of the workflow store in the final_enriched_v2 schema
+({input_info, validation_result} per doctor), as JSONL or Parquet.
+
+    python cli.py export final_enriched.jsonl
+    python cli.py export changes.parquet --incremental   # only records changed since the last export
+
+Records are read from SQLite in keyset pages and written as they arrive, so
+memory stays flat however large the store grows. An incremental export
+starts after the change-sequence watermark left by the previous export
+under the same name; the mark only moves once the file is complete.
+Sequence numbers are stamped when a write commits, so a row committed late
+by another process still lands after the mark.
+read_export() streams any of these files, and the legacy pretty-printed
+JSON array, back one record at a time.
+"""
+import json
+import os
+import time
+from typing import Iterator, Optional
+from confidence_scorer import ConfidenceScorer, VERIFY_THRESHOLD
+from name_index import EMPTY_VALUES, profile_npi
+from workflow_db import WorkflowDB, EXPORT_CHUNK
+
+# Parquet is optional; JSONL needs nothing extra
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# --- CONFIGURATION ---
+EXPORT_STATUSES = ("Verified", "Enriched", "Manual_Review")
+QA_READY_STATUSES = ("Verified", "Enriched")
+# (schema field, profile key); input lines only carry a name, so the rest start empty
+EXPORT_FIELDS = (("name", "name"), ("phone", "phone_no"), ("email", "email"), ("address", "address"))
+SOURCE_TRUST = 0.5          # Any page that matched the doctor
+TRUSTED_SOURCE_TRUST = 0.9  # Pages on ConfidenceScorer.trusted_sources
+CORROBORATION_BONUS = 0.1   # Per extra agreeing source
+READ_CHUNK = 64 * 1024
+
+# --- RECORD MAPPING ---
+def source_trust(profile: dict, trusted=None) -> tuple:
+    """(number of sources, average trust) of the pages the profile was merged from."""
+    trusted = trusted if trusted is not None else ConfidenceScorer().trusted_sources
+    urls = profile.get("sources") or ([profile["source_url"]] if profile.get("source_url") else [])
+    if not urls: return 0, 0.0
+    trust = [TRUSTED_SOURCE_TRUST if any(t in u.lower() for t in trusted) else SOURCE_TRUST for u in urls]
+    return len(urls), sum(trust) / len(trust)
+
+def to_record(name: str, status: str, score: float, profile: dict, trusted=None) -> dict:
+    """One stored doctor as a final_enriched_v2 record."""
+    score = round(float(score or 0), 3)
+    n, avg = source_trust(profile, trusted)
+    trust = min(1.0, avg + CORROBORATION_BONUS * max(0, n - 1))
+    input_info = {"name": name.split(",")[0].strip(), "phone": "", "email": "", "address": ""}
+    fields = []
+    for field, key in EXPORT_FIELDS:
+        original = input_info[field]
+        value = profile.get(key)
+        if value in EMPTY_VALUES and field == "name": value = original
+        if value in EMPTY_VALUES:
+            fields.append({"field": field, "original": original, "final_value": "N/A", "confidence": 0.0,
+                           "action": "manual_review", "reason": "No data found."})
+            continue
+        confidence = round((trust + score) / 2, 3)
+        if confidence < VERIFY_THRESHOLD: action = "Enrichment Needed"
+        elif status == "Verified" and str(value) == original: action = "Verified"
+        else: action = "ENRICHED"
+        fields.append({"field": field, "original": original, "final_value": str(value), "confidence": confidence,
+                       "action": action, "reason": f"Sources: {n} (Avg Trust: {avg:.2f})"})
+    return {"input_info": input_info, "validation_result": {
+        "provider_id": profile_npi(profile) or "N/A",
+        "overall_confidence": score,
+        "fields": fields,
+        "final_action": "ENRICHED_QA_READY" if status in QA_READY_STATUSES else "REVIEW_NEEDED",
+    }}
+
+# --- WRITERS ---
+def _arrow_schema():
+    text = pa.string()
+    return pa.schema([
+        ("input_info", pa.struct([(k, text) for k in ("name", "phone", "email", "address")])),
+        ("validation_result", pa.struct([
+            ("provider_id", text),
+            ("overall_confidence", pa.float64()),
+            ("fields", pa.list_(pa.struct([
+                ("field", text), ("original", text), ("final_value", text),
+                ("confidence", pa.float64()), ("action", text), ("reason", text),
+            ]))),
+            ("final_action", text),
+        ])),
+    ])
+
+class _JsonlWriter:
+    def __init__(self, path: str):
+        self.f = open(path, "w", encoding="utf-8")
+
+    def write(self, records):
+        self.f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+    def close(self):
+        self.f.close()
+
+class _ParquetWriter:
+    def __init__(self, path: str):
+        if pq is None: raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.schema = _arrow_schema()
+        self.w = pq.ParquetWriter(path, self.schema)
+
+    def write(self, records):
+        self.w.write_table(pa.Table.from_pylist(records, schema=self.schema))
+
+    def close(self):
+        self.w.close()
+
+def export_format(path: str, fmt: Optional[str] = None) -> str:
+    return fmt or ("parquet" if path.endswith(".parquet") else "jsonl")
+
+def export_records(db: WorkflowDB, out_path: str, fmt: Optional[str] = None, incremental: bool = False,
+                   watermark: str = "default", statuses=EXPORT_STATUSES, chunksize: int = EXPORT_CHUNK) -> dict:
+    """
+    Writes stored records to `out_path` (.parquet -> Parquet, else JSONL),
+    one page at a time. With `incremental`, only records changed since the
+    `watermark` export. The file is written beside `out_path` and renamed
+    into place before the watermark moves, so a failed export is re-done.
+    """
+    started = time.time()
+    fmt = export_format(out_path, fmt)
+    since = db.get_watermark(watermark) if incremental else 0
+    until = db.change_seq()
+    trusted = ConfidenceScorer().trusted_sources
+    tmp_path = out_path + ".part"
+    writer = _ParquetWriter(tmp_path) if fmt == "parquet" else _JsonlWriter(tmp_path)
+    mark, written, batch = since, 0, []
+    try:
+        for name, status, score, profile, seq in db.iter_changed(statuses, since, until, chunksize):
+            batch.append(to_record(name, status, score, profile, trusted))
+            mark = seq
+            if len(batch) >= chunksize:
+                writer.write(batch)
+                written += len(batch)
+                batch = []
+        if batch or (fmt == "parquet" and not written): writer.write(batch)
+        written += len(batch)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+    os.replace(tmp_path, out_path)
+    if mark != since: db.set_watermark(watermark, mark)
+    return {"path": out_path, "format": fmt, "records": written, "incremental": incremental,
+            "watermark": {"change_seq": mark}, "seconds": round(time.time() - started, 2)}
+
+# --- READER ---
+def _iter_json_array(f) -> Iterator[dict]:
+    """Objects of a (pretty-printed) top-level JSON array, decoded one at a time."""
+    decoder = json.JSONDecoder()
+    buf, eof = "", False
+    while True:
+        buf = buf.lstrip(" \t\r\n[,")
+        if buf.startswith("]"): return
+        try:
+            obj, end = decoder.raw_decode(buf)
+        except json.JSONDecodeError:
+            if eof:
+                if buf.strip(): raise
+                return
+            chunk = f.read(READ_CHUNK)
+            eof = not chunk
+            buf += chunk
+            continue
+        yield obj
+        buf = buf[end:]
+
+def read_export(path: str, batch_size: int = EXPORT_CHUNK) -> Iterator[dict]:
+    """Streams records back from a JSONL or Parquet export (or a JSON array file)."""
+    if path.endswith(".parquet"):
+        if pq is None: raise RuntimeError("Reading Parquet needs pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+        return
+    with open(path, encoding="utf-8") as f:
+        first = f.read(1)
+        while first.isspace(): first = f.read(1)
+        if first == "[":
+            yield from _iter_json_array(f)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip(): yield json.loads(line)
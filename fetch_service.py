@@ -0,0 +1,204 @@
+"""
+Warm fetchers shared across pipeline runs.
+
+A FetchService keeps one crawl4ai crawler and one StealthBrowser alive
+between runs, so only the first run pays for launching Chromium. Runs
+borrow them with lease(); while no run holds them they are health-checked
+and replaced after RECYCLE_AFTER_RUNS runs or RECYCLE_AFTER_SECONDS.
+
+A service belongs to one event loop. Hosts that start a fresh loop per
+call (Streamlit re-runs the whole script) use BackgroundLoop, which runs
+a single loop on a daemon thread for the life of the process.
+
+The heavy client libraries (crawl4ai, nodriver, openai, ddgs) are imported
+where they are first used, so hosts start without loading them.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import queue
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Callable, Iterator, Optional
+from scraper_helper import StealthBrowser
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+RECYCLE_AFTER_RUNS = 20         # Fresh browsers after this many runs...
+RECYCLE_AFTER_SECONDS = 3600    # ...or this long, whichever comes first
+HEALTH_CHECK_INTERVAL = 60      # Seconds between probes of idle fetchers
+HEALTH_CHECK_TIMEOUT = 10
+PROBE_URL = "raw:<html><body>ok</body></html>"  # Rendered without any network
+SHUTDOWN_TIMEOUT = 10
+
+def default_crawler():
+    """crawl4ai (and Playwright behind it) is only imported when a crawler is first needed."""
+    from crawl4ai import AsyncWebCrawler, BrowserConfig
+    return AsyncWebCrawler(config=BrowserConfig(headless=True))
+
+class FetchService:
+    """
+    Owns the crawler / stealth browser pair. The crawler is opened on the
+    first lease; the stealth browser only launches when a fetch first
+    falls back to it (or on warm()).
+    """
+    def __init__(self, crawler_factory: Callable = default_crawler, stealth_factory: Callable = StealthBrowser):
+        self.crawler_factory = crawler_factory
+        self.stealth_factory = stealth_factory
+        self.crawler = None
+        self.stealth = None
+        self._opened = 0.0
+        self._checked = 0.0
+        self._runs = 0
+        self._leases = 0
+        self._lock = asyncio.Lock()
+
+    @contextlib.asynccontextmanager
+    async def lease(self) -> AsyncIterator[tuple]:
+        """Yields (crawler, stealth) for one run; concurrent runs share them."""
+        async with self._lock:
+            if self._leases == 0: await self._ready()
+            self._leases += 1
+            self._runs += 1
+        try:
+            yield self.crawler, self.stealth
+        finally:
+            self._leases -= 1
+
+    async def warm(self):
+        """Opens the crawler and launches the stealth browser ahead of the first run."""
+        async with self._lock:
+            if self._leases == 0: await self._ready()
+            stealth = self.stealth
+        await stealth.start()
+
+    async def healthy(self) -> bool:
+        try:
+            probe = await asyncio.wait_for(self.crawler.arun(url=PROBE_URL), HEALTH_CHECK_TIMEOUT)
+            if not getattr(probe, "success", False): return False
+        except Exception:
+            return False
+        return await self.stealth.healthy()
+
+    async def close(self):
+        async with self._lock:
+            await self._close()
+
+    # --- LIFECYCLE ---
+    async def _ready(self):
+        """Opens, probes or recycles the fetchers; only called while no run holds them."""
+        if self.crawler is not None:
+            if self._runs >= RECYCLE_AFTER_RUNS or time.time() - self._opened >= RECYCLE_AFTER_SECONDS:
+                METRICS.inc("fetch_service", event="recycle")
+                await self._close()
+            elif time.time() - self._checked >= HEALTH_CHECK_INTERVAL:
+                self._checked = time.time()
+                if not await self.healthy():
+                    METRICS.inc("fetch_service", event="unhealthy")
+                    await self._close()
+                else:
+                    METRICS.inc("fetch_service", event="reuse")
+            else:
+                METRICS.inc("fetch_service", event="reuse")
+        if self.crawler is None:
+            crawler = self.crawler_factory()
+            await crawler.__aenter__()
+            self.crawler, self.stealth = crawler, self.stealth_factory()
+            self._opened = self._checked = time.time()
+            self._runs = 0
+            METRICS.inc("fetch_service", event="open")
+
+    async def _close(self):
+        crawler, stealth = self.crawler, self.stealth
+        self.crawler = self.stealth = None
+        if stealth is not None:
+            with contextlib.suppress(Exception): await stealth.close()
+        if crawler is not None:
+            with contextlib.suppress(Exception): await crawler.__aexit__(None, None, None)
+
+# --- SHARED INSTANCES ---
+_SERVICES = weakref.WeakKeyDictionary()
+
+def get_fetch_service() -> FetchService:
+    """The service for the running loop (see get_llm_client)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _SERVICES: _SERVICES[loop] = FetchService()
+    return _SERVICES[loop]
+
+async def close_fetch_service():
+    service = _SERVICES.pop(asyncio.get_running_loop(), None)
+    if service: await service.close()
+
+class BackgroundLoop:
+    """
+    One event loop on a daemon thread for the life of the process, so
+    per-loop clients (fetchers, LLM/search clients) stay warm across
+    Streamlit re-runs. Browsers are closed at interpreter exit.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="refinery-loop", daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: Optional[float] = None):
+        return self.submit(coro).result(timeout)
+
+    def stream(self, agen, heartbeat: Optional[float] = None) -> Iterator:
+        """
+        Drives an async generator on the loop and yields its items in the
+        calling thread. Abandoning the iterator cancels the generator.
+        With `heartbeat`, None is yielded whenever that many seconds pass
+        without an item, so the caller can redraw while the run is busy.
+        """
+        items = queue.Queue()
+        end = object()
+
+        async def pump():
+            try:
+                async for item in agen: items.put(item)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(end)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield None
+                    continue
+                if item is end: return
+                if isinstance(item, Exception): raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def fetch_service(self) -> FetchService:
+        return self.run(self._service())
+
+    @staticmethod
+    async def _service() -> FetchService:
+        return get_fetch_service()
+
+    def shutdown(self):
+        if not self.loop.is_running(): return
+        with contextlib.suppress(Exception):
+            self.run(close_fetch_service(), SHUTDOWN_TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+_BACKGROUND: Optional[BackgroundLoop] = None
+_BACKGROUND_LOCK = threading.Lock()
+
+def get_background_loop() -> BackgroundLoop:
+    global _BACKGROUND
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND is None: _BACKGROUND = BackgroundLoop()
+    return _BACKGROUND
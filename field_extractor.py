@@ -0,0 +1,145 @@
+import re
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+from metrics import METRICS
+from text_window import name_sections, name_tokens
+
+# --- CONFIGURATION ---
+# CSS selectors applied by html_prep while the tree is parsed. schema.org
+# microdata is common on directory pages; domains can override per field.
+DEFAULT_SELECTORS = {
+    "name": "h1",
+    "phone_no": "[itemprop=telephone], a[href^='tel:']",
+    "address": "[itemprop=address], address",
+}
+DOMAIN_SELECTORS = {
+    "npidb.org": {"npi_id": "[itemprop=identifier]"},
+    "health.usnews.com": {"name": "h1[data-testid], h1"},
+    "npiregistry.cms.hhs.gov": {"npi_id": "td.npi, [data-label=NPI]"},
+}
+# Fields a page must yield before the profile LLM call is skipped outright;
+# covers every field ConfidenceScorer weights, so a fast-path record is not
+# sent to the Phase 3 hunt for a license the LLM was never asked for
+FAST_PATH_REQUIRED = ("name", "npi_id", "license_id", "phone_no", "address")
+
+NPI_LABELED = re.compile(r'\bNPI(?:\s*(?:Number|No\.?|#|ID))?\s*[:#-]?\s*(\d{10})\b', re.I)
+NPI_BARE = re.compile(r'\b(\d{10})\b')
+LICENSE_LABELED = re.compile(
+    r'\b(?:State\s+)?(?:Medical\s+)?(?:Licen[cs]e|Registration)\s*(?:Number|No\.?|#|ID)?\s*[:#-]?\s*'
+    r'([A-Z]{0,4}[- ]?\d{3,10}[A-Z0-9-]*)\b',
+    re.I
+)
+LICENSE_VALUE = re.compile(r'^[A-Z]{0,4}[- ]?\d{3,10}[A-Z0-9-]*$', re.I)
+PHONE_LABELED = re.compile(
+    r'\b(?:Phone|Tel(?:ephone)?|Call|Contact)\s*(?:No\.?|Number|#)?\s*[:.-]?\s*'
+    r'((?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4})\b',
+    re.I
+)
+PHONE_ANY = re.compile(r'(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b')
+US_ADDRESS = re.compile(
+    r'\b\d{1,6}\s+[A-Za-z0-9.\' ]{2,60}?,\s*(?:(?:Suite|Ste\.?|Floor|Fl\.?|#)\s*[\w-]+,\s*)?'
+    r'[A-Za-z .\']{2,40},\s*[A-Z]{2}\s+\d{5}(?:-\d{4})?\b'
+)
+# Directory / registry domains where an unlabeled 10-digit number is the NPI
+NPI_DOMAINS = ("npidb.org", "npiregistry.cms.hhs.gov", "npino.com")
+
+# --- VALIDATORS ---
+def npi_is_valid(npi: str) -> bool:
+    """CMS check digit: Luhn over '80840' + the first 9 digits."""
+    digits = re.sub(r'\D', '', str(npi or ''))
+    if len(digits) != 10: return False
+    total = 0
+    for i, ch in enumerate(reversed("80840" + digits[:9])):
+        d = int(ch)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9: d -= 9
+        total += d
+    return (10 - total % 10) % 10 == int(digits[9])
+
+def clean_phone(raw: str) -> Optional[str]:
+    digits = re.sub(r'\D', '', raw or '')
+    if len(digits) == 11 and digits.startswith('1'): digits = digits[1:]
+    if len(digits) != 10 or digits[0] in '01': return None
+    return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+
+def validate_field(field: str, value) -> Optional[str]:
+    """
+    Cleaned value if it passes the field's format check, else None.
+    Used on model output, which the regex extractor already guarantees.
+    """
+    value = " ".join(str(value or "").split())
+    if not value or value.upper() == "N/A": return None
+    if field == "npi_id":
+        return re.sub(r'\D', '', value) if npi_is_valid(value) else None
+    if field == "license_id":
+        return value if LICENSE_VALUE.match(value) else None
+    if field == "phone_no":
+        return clean_phone(value)
+    return value
+
+def selectors_for(url: str) -> Dict[str, str]:
+    host = (urlsplit(url).hostname or "").lower()
+    merged = dict(DEFAULT_SELECTORS)
+    for domain, selectors in DOMAIN_SELECTORS.items():
+        if host == domain or host.endswith("." + domain): merged.update(selectors)
+    return merged
+
+# --- EXTRACTOR ---
+def extract_fields(text: str, hints: Dict[str, str], url: str) -> Dict[str, str]:
+    """
+    Deterministic extraction from selector hits (`hints`) and page text.
+    Only values that pass validation are returned.
+    """
+    found = {}
+    host = (urlsplit(url).hostname or "").lower()
+
+    # NPI: selector hit, then labeled, then bare numbers on registry domains
+    candidates = [hints.get("npi_id", "")] + NPI_LABELED.findall(text)
+    if any(host.endswith(d) for d in NPI_DOMAINS): candidates += NPI_BARE.findall(text)
+    for c in candidates:
+        if npi_is_valid(c):
+            found["npi_id"] = re.sub(r'\D', '', c)
+            break
+
+    m = LICENSE_LABELED.search(text)
+    if m and re.search(r'\d{3}', m.group(1)): found["license_id"] = m.group(1).strip()
+
+    for raw in [hints.get("phone_no", "")] + PHONE_LABELED.findall(text):
+        phone = clean_phone(raw)
+        if phone:
+            found["phone_no"] = phone
+            break
+
+    address = hints.get("address", "").strip()
+    if not US_ADDRESS.search(address):
+        m = US_ADDRESS.search(text)
+        address = m.group(0) if m else ""
+    if address: found["address"] = " ".join(address.split())
+
+    name = " ".join(hints.get("name", "").split())
+    if 3 <= len(name) <= 80: found["name"] = name
+    return found
+
+def extract_for(name: str, text: str, hints: Dict[str, str], url: str) -> Dict[str, str]:
+    """
+    extract_fields limited to the text right after each mention of `name`,
+    so a listing page cannot lend another doctor's NPI, license or phone.
+    Selector hits count only when the page heading names the doctor.
+    """
+    tokens = name_tokens(name)
+    heading = hints.get("name", "").lower()
+    if not (tokens and all(t in heading for t in tokens)): hints = {}
+    return extract_fields(name_sections(text, tokens), hints, url)
+
+def missing_after(found: Dict[str, str], wanted: Iterable[str]):
+    return [f for f in wanted if not found.get(f)]
+
+def fast_path_report() -> str:
+    """How often rules saved an LLM call in the current run (from METRICS)."""
+    avoided = int(METRICS.counter_value("extraction", path="rules"))
+    calls = avoided + int(METRICS.counter_value("extraction", path="llm"))
+    if not calls: return "No extractions yet."
+    pct = int(100 * avoided / calls)
+    filled = int(METRICS.counter_value("rule_fields") + METRICS.counter_value("enriched_fields", source="rules"))
+    return f"{avoided}/{calls} LLM calls avoided ({pct}%), {filled} fields filled by rules"
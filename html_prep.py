@@ -0,0 +1,85 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from field_extractor import selectors_for
+from metrics import METRICS
+
+# lxml is several times faster than the pure-Python parser; use it when installed
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# --- CONFIGURATION ---
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+POOL_MIN_CHARS = 40000   # Smaller pages are parsed inline; pickling costs more than it saves
+STRIP_TAGS = ["script", "style", "nav", "footer", "svg", "noscript"]
+DOC_EXTENSIONS = ('.pdf', '.doc', '.docx')
+IMAGE_KEYWORDS = ['cert', 'award', 'license', 'board']
+
+class PreparedPage(NamedTuple):
+    assets: Dict[str, List[str]]
+    text: str
+    hints: Dict[str, str]   # Text of per-domain selector hits, see field_extractor
+
+EMPTY_PAGE = PreparedPage({"documents": [], "images": []}, "", {})
+
+def preprocess_html(html: str, base_url: str) -> PreparedPage:
+    """
+    Parses a document once and returns the asset links (PDF/DOC files,
+    certificate images), the cleaned visible text and selector hits.
+    """
+    if not html or not isinstance(html, str): return EMPTY_PAGE
+    soup = BeautifulSoup(html, PARSER)
+    assets = {"documents": [], "images": []}
+
+    for link in soup.find_all('a', href=True):
+        href = link['href'].lower()
+        if href.endswith(DOC_EXTENSIONS):
+            assets["documents"].append(urljoin(base_url, link['href']))
+
+    for img in soup.find_all('img', src=True):
+        alt = img.get('alt', '').lower()
+        if any(k in alt for k in IMAGE_KEYWORDS):
+            assets["images"].append(urljoin(base_url, img['src']))
+
+    hints = {}
+    for field, css in selectors_for(base_url).items():
+        try:
+            node = soup.select_one(css)
+        except Exception:
+            continue # Bad selector or unsupported by the backend
+        if node: hints[field] = node.get_text(separator=' ', strip=True)
+
+    for x in soup(STRIP_TAGS): x.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    return PreparedPage({k: list(set(v)) for k, v in assets.items()}, text, hints)
+
+# --- PROCESS POOL ---
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None: _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _pool
+
+async def prepare_page(html: str, base_url: str) -> PreparedPage:
+    """Async wrapper: large documents are parsed in a process pool, off the event loop."""
+    global _pool
+    if not html or not isinstance(html, str): return EMPTY_PAGE
+    if len(html) < POOL_MIN_CHARS or PARSE_WORKERS < 2:
+        with METRICS.timer("parse", mode="inline"):
+            return preprocess_html(html, base_url)
+    try:
+        with METRICS.timer("parse", mode="pool"):
+            return await asyncio.get_running_loop().run_in_executor(_get_pool(), preprocess_html, html, base_url)
+    except BrokenProcessPool:
+        _pool = None # A worker died; rebuild the pool next time
+        METRICS.inc("fallbacks", kind="parse_pool")
+        with METRICS.timer("parse", mode="inline"):
+            return preprocess_html(html, base_url)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+import weakref
+from typing import List, Optional
+import httpx
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+LLM_API_URL = "http://localhost:8080/v1"
+LLM_MODEL = "gpt-3.5-turbo"
+LLM_TEMPERATURE = 0.1
+LLM_MAX_CONCURRENCY = 4   # Requests in flight against the local server
+LLM_POOL_SIZE = 8         # Keep-alive HTTP connections
+LLM_TIMEOUT = 120
+LLM_BATCH_SIZE = 1        # > 1 enables micro-batching via /v1/completions
+LLM_BATCH_WINDOW = 0.05   # Seconds to wait for a batch to fill up
+LLM_MAX_TOKENS = 1024     # Only used by batched completions
+
+def record_usage(kind: str, started: float, response, prompts: int = 1):
+    """Latency, call and token counters for one server round trip."""
+    METRICS.observe("llm", time.perf_counter() - started, kind=kind)
+    METRICS.inc("llm_requests", kind=kind)
+    METRICS.inc("llm_prompts", prompts, kind=kind)
+    usage = getattr(response, "usage", None)
+    if usage:
+        METRICS.inc("llm_tokens", usage.prompt_tokens or 0, type="prompt")
+        METRICS.inc("llm_tokens", usage.completion_tokens or 0, type="completion")
+
+def clean_json_reply(content: str) -> dict:
+    """Strips markdown fences from a model reply and parses the JSON inside."""
+    if "```json" in content: content = content.split("```json")[1].split("```")[0]
+    elif "```" in content: content = content.split("```")[1].split("```")[0]
+    return json.loads(content)
+
+class LLMClient:
+    """
+    Shared async client for the local OpenAI-compatible server.
+    One pooled HTTP client, a concurrency cap, and optional micro-batching:
+    prompts arriving within LLM_BATCH_WINDOW are sent as one `prompt=[...]`
+    completions request. If the server rejects batches, the client falls back
+    to one chat request per prompt for the rest of its life.
+    """
+    def __init__(self, base_url: str = LLM_API_URL, model: str = LLM_MODEL,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, batch_size: int = LLM_BATCH_SIZE,
+                 batch_window: float = LLM_BATCH_WINDOW):
+        from openai import AsyncOpenAI
+        pool = httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE)
+        self.client = AsyncOpenAI(
+            base_url=base_url, api_key="sk-none",
+            http_client=httpx.AsyncClient(limits=pool, timeout=LLM_TIMEOUT)
+        )
+        self.model = model
+        self.sem = asyncio.Semaphore(max_concurrency)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.batching_supported = True
+        self._pending = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches = set()
+
+    # --- PUBLIC API ---
+    async def complete(self, prompt: str, system: Optional[str] = None) -> str:
+        if self.batch_size > 1 and self.batching_supported:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending.append((system, prompt, fut))
+            if len(self._pending) >= self.batch_size: self._flush()
+            elif not self._timer:
+                self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+            return await fut
+        return await self._chat(system, prompt)
+
+    async def complete_json(self, prompt: str, system: Optional[str] = None) -> dict:
+        return clean_json_reply(await self.complete(prompt, system))
+
+    async def close(self):
+        await self.client.close()
+
+    # --- SINGLE REQUEST ---
+    async def _chat(self, system: Optional[str], prompt: str) -> str:
+        messages = [{"role": "user", "content": prompt}]
+        if system: messages.insert(0, {"role": "system", "content": system})
+        async with self.sem:
+            started = time.perf_counter()
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=LLM_TEMPERATURE
+            )
+            record_usage("chat", started, response)
+        return response.choices[0].message.content
+
+    # --- MICRO-BATCHING ---
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[tuple]):
+        if len(batch) == 1:
+            system, prompt, fut = batch[0]
+            await self._resolve(fut, self._chat(system, prompt))
+            return
+
+        prompts = [
+            (f"### System:\n{system}\n\n" if system else "") + f"### User:\n{prompt}\n\n### Assistant:\n"
+            for system, prompt, _ in batch
+        ]
+        try:
+            async with self.sem:
+                started = time.perf_counter()
+                response = await self.client.completions.create(
+                    model=self.model,
+                    prompt=prompts,
+                    temperature=LLM_TEMPERATURE,
+                    max_tokens=LLM_MAX_TOKENS
+                )
+                record_usage("batch", started, response, len(prompts))
+            texts = {c.index: c.text for c in response.choices}
+            if len(texts) != len(batch): raise ValueError(f"expected {len(batch)} choices, got {len(texts)}")
+        except Exception as e:
+            print(f"│ ⚠️  LLM batching unsupported ({e}), falling back to single requests")
+            METRICS.inc("fallbacks", kind="llm_batch")
+            self.batching_supported = False
+            await asyncio.gather(*(self._resolve(fut, self._chat(s, p)) for s, p, fut in batch))
+            return
+
+        for i, (_, _, fut) in enumerate(batch):
+            if not fut.done(): fut.set_result(texts[i])
+
+    @staticmethod
+    async def _resolve(fut: asyncio.Future, coro):
+        try:
+            result = await coro
+            if not fut.done(): fut.set_result(result)
+        except Exception as e:
+            if not fut.done(): fut.set_exception(e)
+
+# --- SHARED INSTANCE ---
+# asyncio primitives and pooled connections are bound to the loop that created
+# them, and Streamlit starts a fresh loop per run, so share one client per loop.
+_CLIENTS = weakref.WeakKeyDictionary()
+
+def get_llm_client() -> LLMClient:
+    loop = asyncio.get_running_loop()
+    if loop not in _CLIENTS: _CLIENTS[loop] = LLMClient()
+    return _CLIENTS[loop]
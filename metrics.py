@@ -0,0 +1,154 @@
+import bisect
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# --- CONFIGURATION ---
+# Seconds; covers cache hits (ms) up to slow stealth renders and LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+PROFILE_JSON = "run_profile.json"
+PROFILE_CSV = "run_profile.csv"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation, capped at the max seen."""
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+class Metrics:
+    """
+    Process-wide registry of labelled counters and latency histograms.
+    Stages record into it and RefineryPipeline writes a profile at the end of
+    each run (JSON + CSV); to_prometheus() renders the text exposition format.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters: Dict[str, Dict[LabelKey, float]] = {}
+            self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+            self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _labels(labels)
+            if key not in series: series[key] = Histogram()
+            series[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Records the block's duration, also when it raises or is cancelled."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter_value(self, name: str, **labels) -> float:
+        """Sum over every series of `name` matching the given labels."""
+        want = set(_labels(labels))
+        return sum(v for k, v in self.counters.get(name, {}).items() if want <= set(k))
+
+    # --- REPORTS ---
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "elapsed_seconds": round(time.time() - self.started, 2),
+                "counters": [
+                    {"name": n, "labels": dict(k), "value": v}
+                    for n, series in sorted(self.counters.items()) for k, v in series.items()
+                ],
+                "histograms": [
+                    {"name": n, "labels": dict(k), "count": h.count, "sum": round(h.sum, 3),
+                     "avg": round(h.sum / h.count, 3) if h.count else 0,
+                     "p50": h.quantile(0.5), "p95": h.quantile(0.95), "max": round(h.max, 3)}
+                    for n, series in sorted(self.histograms.items()) for k, h in series.items()
+                ],
+            }
+
+    def write_report(self, json_path: str = PROFILE_JSON, csv_path: str = PROFILE_CSV) -> dict:
+        snap = self.snapshot()
+        with open(json_path, "w") as f: json.dump(snap, f, indent=2)
+        with open(csv_path, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["type", "name", "labels", "count", "sum", "avg", "p50", "p95", "max", "value"])
+            for c in snap["counters"]:
+                w.writerow(["counter", c["name"], json.dumps(c["labels"]), "", "", "", "", "", "", c["value"]])
+            for h in snap["histograms"]:
+                w.writerow(["histogram", h["name"], json.dumps(h["labels"]), h["count"], h["sum"],
+                            h["avg"], h["p50"], h["p95"], h["max"], ""])
+        return snap
+
+    def summary(self) -> str:
+        """One line per stage, slowest total first, for the run log."""
+        rows = []
+        for name, series in self.histograms.items():
+            for key, h in series.items():
+                if not h.count or dict(key).get("domain"): continue
+                label = ",".join(v for _, v in key)
+                rows.append((h.sum, f"{name}{'[' + label + ']' if label else ''}: "
+                                    f"n={h.count} avg={h.sum / h.count:.2f}s p95≤{h.quantile(0.95)}s"))
+        return " | ".join(r for _, r in sorted(rows, reverse=True)[:6]) or "No timings recorded."
+
+    def to_prometheus(self, prefix: str = "refinery_") -> str:
+        def fmt(key, extra=()):
+            pairs = list(key) + list(extra)
+            if not pairs: return ""
+            escaped = (f'{k}="{v}"'.replace("\n", " ") for k, v in pairs)
+            return "{" + ",".join(escaped) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                for key, v in series.items():
+                    lines.append(f"{prefix}{name}_total{fmt(key)} {v}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name}_seconds histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, c in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += c
+                        lines.append(f"{prefix}{name}_seconds_bucket{fmt(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{prefix}{name}_seconds_sum{fmt(key)} {h.sum}")
+                    lines.append(f"{prefix}{name}_seconds_count{fmt(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+# --- SHARED INSTANCE ---
+METRICS = Metrics()
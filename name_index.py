@@ -0,0 +1,120 @@
+import re
+from itertools import combinations
+from typing import Iterable, List, Optional, Tuple
+from thefuzz import fuzz
+from field_extractor import npi_is_valid
+from text_window import name_tokens, TITLE_WORDS
+
+# --- CONFIGURATION ---
+SAME_DOCTOR_SCORE = 92     # token_sort_ratio on normalised names, inside a block
+# Post-nominals on top of text_window.TITLE_WORDS
+EXTRA_TITLES = {"facp", "fasn", "facc", "facs", "frcp", "mrcp", "dm", "mrcs", "fics", "dnb", "mbbs", "jr", "sr"}
+EMPTY_VALUES = (None, "", "N/A", [], {})
+NPI_IN_LINE = re.compile(r"\b\d{10}\b")
+
+# --- KEYS ---
+def person_tokens(line: str) -> List[str]:
+    """Name tokens of an input line: text before the first comma, titles and initials dropped."""
+    return [t for t in name_tokens(line.split(",")[0]) if t not in EXTRA_TITLES]
+
+def name_key(line: str) -> str:
+    """Order- and title-free key: 'Dr.Nidhi Rawal,Pediatrics' and 'Nidhi Rawal MD' share it."""
+    return " ".join(sorted(person_tokens(line)))
+
+def qualifiers(line: str) -> set:
+    """
+    Normalised specialty/location parts after the name. Degrees such as
+    ', M.D.' are not qualifiers and NPIs are compared separately.
+    """
+    parts = [p for p in line.split(",")[1:] if not NPI_IN_LINE.search(p)]
+    words = (re.findall(r"[a-z]+", p.lower()) for p in parts)
+    return {" ".join(w for w in ws if w not in TITLE_WORDS | EXTRA_TITLES) for ws in words} - {""}
+
+def line_npi(line: str) -> Optional[str]:
+    """A valid NPI written on the input line, if any."""
+    return next((n for n in NPI_IN_LINE.findall(line) if npi_is_valid(n)), None)
+
+def soundex(word: str) -> str:
+    codes = {**dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+             "l": "4", **dict.fromkeys("mn", "5"), "r": "6"}
+    word = re.sub(r"[^a-z]", "", word.lower())
+    if not word: return ""
+    out, last = word[0].upper(), codes.get(word[0], "")
+    for ch in word[1:]:
+        code = codes.get(ch, "")
+        if code and code != last: out += code
+        if ch not in "hw": last = code
+    return (out + "000")[:4]
+
+def block_keys(line: str) -> List[str]:
+    """
+    Blocking keys for the store: the exact normalised name plus every pair
+    of phonetic tokens, so 'Mohammad Rafiq' and 'Mohammed Rafiq MD' share
+    a block while blocks stay small as the table grows.
+    """
+    tokens = person_tokens(line)
+    if not tokens: return []
+    keys = {"n:" + " ".join(sorted(tokens))}
+    codes = sorted({soundex(t) for t in tokens if len(t) > 2} or {soundex(tokens[0])})
+    if len(codes) == 1: keys.add("p:" + codes[0])
+    keys.update(f"p:{a}+{b}" for a, b in combinations(codes, 2))
+    return sorted(keys)
+
+def profile_npi(profile: dict) -> Optional[str]:
+    npi = re.sub(r"\D", "", str((profile or {}).get("npi_id") or (profile or {}).get("npi") or ""))
+    return npi if npi_is_valid(npi) else None
+
+# --- MATCHING ---
+def same_identity(a: str, b: str) -> bool:
+    """
+    Whether two lines may name the same doctor beyond the name itself: NPIs
+    written on both must be equal, and qualifiers given on both must not
+    conflict. A line without qualifiers is compatible with any other, but
+    'John Smith, Dermatology, TX' never joins 'John Smith, Cardiology, NY'.
+    """
+    npi_a, npi_b = line_npi(a), line_npi(b)
+    if npi_a and npi_b and npi_a != npi_b: return False
+    qual_a, qual_b = qualifiers(a), qualifiers(b)
+    return not (qual_a and qual_b) or qual_a <= qual_b or qual_b <= qual_a
+
+def best_match(line: str, candidates: Iterable[Tuple[str, str]]) -> Optional[Tuple[str, str, int]]:
+    """
+    Fuzzy-scores `line` against (name, status) candidates from one block.
+    Returns (name, status, score) of the best one at SAME_DOCTOR_SCORE or
+    above whose qualifiers and NPI do not conflict (see same_identity).
+    """
+    key = name_key(line)
+    best = None
+    for name, status in candidates:
+        if not same_identity(line, name): continue
+        score = 100 if name_key(name) == key else fuzz.token_sort_ratio(key, name_key(name))
+        if score >= SAME_DOCTOR_SCORE and (best is None or score > best[2]):
+            best = (name, status, score)
+    return best
+
+# --- MERGING ---
+def merge_profiles(profiles: List[dict]) -> dict:
+    """
+    Folds every matched source into the best one (profiles[0]): empty fields
+    are filled from the others, assets are unioned and all source URLs kept.
+    A source with a different valid NPI is another doctor and is ignored.
+    """
+    if not profiles: return {}
+    merged = dict(profiles[0])
+    npi = profile_npi(merged)
+    sources = [merged.get("source_url")] if merged.get("source_url") else []
+    assets = {k: list(v) for k, v in (merged.get("assets") or {}).items()}
+    for other in profiles[1:]:
+        other_npi = profile_npi(other)
+        if npi and other_npi and other_npi != npi: continue
+        npi = npi or other_npi
+        for field, value in other.items():
+            if field in ("source_url", "assets", "sources"): continue
+            if merged.get(field) in EMPTY_VALUES and value not in EMPTY_VALUES: merged[field] = value
+        if other.get("source_url") and other["source_url"] not in sources: sources.append(other["source_url"])
+        for kind, links in (other.get("assets") or {}).items():
+            bucket = assets.setdefault(kind, [])
+            bucket.extend(l for l in links if l not in bucket)
+    if assets: merged["assets"] = assets
+    if len(sources) > 1: merged["sources"] = sources
+    return merged
@@ -1,92 +1,408 @@
 import asyncio
-from workflow_db import WorkflowDB
-from confidence_scorer import ConfidenceScorer
-from enrichment_agent import EnrichmentAgent
-from search_scraper import process_doctor 
-from scraper_helper import StealthBrowser
-from crawl4ai import AsyncWebCrawler, BrowserConfig
+import itertools
+import time
+from typing import Optional
+from workflow_db import WorkflowDB, DB_PATH, DONE_STATUSES
+from confidence_scorer import ConfidenceScorer, VERIFY_THRESHOLD
+from enrichment_agent import EnrichmentAgent, HuntBudget, HUNT_RESULTS
+from search_scraper import process_doctor, BATCH_SIZE, PER_HOST_LIMIT
+from scraper_helper import HostLimiter
+from domain_stats import get_domain_stats
+from field_extractor import fast_path_report
+from cache_store import get_llm_cache, get_page_cache, get_search_cache
+from progress import log, phase, doctor
+from name_index import best_match, line_npi, merge_profiles, name_key, profile_npi, same_identity
+from asset_verifier import verify_assets
+from fetch_service import FetchService
+from metrics import METRICS, PROFILE_JSON, PROFILE_CSV
+
+# --- CONFIGURATION ---
+ENRICH_WORKERS = 2        # Doctors enriched concurrently
+SCORE_QUEUE_SIZE = 50     # Scraped profiles waiting to be scored
+ENRICH_QUEUE_SIZE = 20    # Low-score profiles waiting for a deep hunt
+HOPELESS_MAX_URLS = 2     # Hunt size for records that cannot reach the threshold
+ENRICH_FETCH_BUDGET = None  # Max enrichment fetches per run (None = unlimited)
+ENRICH_TIME_BUDGET = None   # Seconds of enrichment per run (None = unlimited)
+_LAST = (float("inf"),)   # Sorts queue sentinels behind every real record
+REUSE_STATUSES = ("Verified", "Enriched")  # Stored results good enough to serve again
+
+def _cache_lookups(cache) -> str:
+    """This run's hits/misses for a DiskCache (its own counters span the process)."""
+    hits = int(METRICS.counter_value("cache_lookups", cache=cache.name, result="hit"))
+    misses = int(METRICS.counter_value("cache_lookups", cache=cache.name, result="miss"))
+    return f"{hits} hits / {misses} misses"
 
 class RefineryPipeline:
-    def __init__(self):
-        self.db = WorkflowDB()
+    """
+    Discovery -> Scoring -> Enrichment as overlapping stages joined by
+    bounded queues. A full queue pauses the stage feeding it, and every
+    record's result is yielded as soon as its last stage completes.
+    Enrichment takes the queued record with the best chance of reaching
+    VERIFY_THRESHOLD first, within an optional per-run fetch/time budget;
+    records past the budget stay Queued for the next run.
+    run() yields progress.ProgressEvent objects.
+    """
+    def __init__(self, workers: int = BATCH_SIZE, per_host: int = PER_HOST_LIMIT,
+                 enrich_workers: int = ENRICH_WORKERS, db_path: str = DB_PATH,
+                 prometheus_path: Optional[str] = None,
+                 enrich_fetch_budget: Optional[int] = ENRICH_FETCH_BUDGET,
+                 enrich_time_budget: Optional[float] = ENRICH_TIME_BUDGET,
+                 reuse_stored: bool = True, check_assets: bool = True,
+                 fetch_service: Optional[FetchService] = None):
+        self.db = WorkflowDB(db_path)
         self.scorer = ConfidenceScorer()
         self.enricher = EnrichmentAgent()
+        self.workers = workers
+        self.per_host = per_host
+        self.enrich_workers = enrich_workers
+        self.prometheus_path = prometheus_path   # Also export the run profile in Prometheus text format
+        self.enrich_fetch_budget = enrich_fetch_budget
+        self.enrich_time_budget = enrich_time_budget
+        self.reuse_stored = reuse_stored   # Serve duplicates / already-verified doctors from the DB
+        self.check_assets = check_assets   # Download linked documents and look for the doctor in them
+        # Warm crawler/browser shared across runs; without one, each run opens and closes its own
+        self.fetch_service = fetch_service
+        self._aliases = {}
         self.stop_signal = False
 
     def stop(self):
         self.stop_signal = True
 
-    async def run(self, doctor_list):
+    @staticmethod
+    def missing_fields(details):
+        missing = []
+        if not details.get('npi'): missing.append('npi_id')
+        if not details.get('license'): missing.append('license_id')
+        return missing
+
+    def _enrich_entry(self, item):
+        """
+        Priority-queue entry for a (name, profile, missing, score) record.
+        Records that can still reach the threshold come first, closest to it
+        first, then by the most score a hunt could add; input order breaks ties.
+        """
+        _, _, missing, score = item
+        gain = self.scorer.potential_gain(missing)
+        reachable = score + gain >= VERIFY_THRESHOLD
+        shortfall = max(0.0, VERIFY_THRESHOLD - score)
+        return (0 if reachable else 1, round(shortfall, 2), -gain), next(self._enrich_seq), item
+
+    def _restore(self, doctor_list, scraped_batch, pending_batch):
+        """
+        Splits a resumed run by stored progress: finished doctors are skipped,
+        Pending ones go straight to scoring and Queued ones to enrichment.
+        Returns the (index, name) jobs that still need Phase 1.
+        """
+        stored = self.db.get_records(doctor_list)
+        jobs = []
+        for i, name in enumerate(doctor_list):
+            rec = stored.get(name)
+            if rec is None or rec['status'] not in (*DONE_STATUSES, "Pending", "Queued"):
+                jobs.append((i, name))
+            elif rec['status'] == "Pending":
+                scraped_batch[name] = rec['profile']
+            elif rec['status'] == "Queued":
+                missing = rec['details'].get('missing') or self.missing_fields(rec['details'])
+                pending_batch.append((name, rec['profile'], missing, rec['initial_score']))
+        return jobs
+
+    def _link(self, jobs):
+        """
+        Matches incoming names against each other and the store before any
+        search. Later spellings of a name in this batch become aliases of the
+        first one; names matching a stored Verified/Enriched doctor are served
+        from it. Returns (jobs still to scrape, events for served names).
+        """
+        self._aliases = {}
+        primaries, remaining, served = {}, [], []
+        for i, name in jobs:
+            key = name_key(name)
+            primary = next((p for p in primaries.get(key, ()) if same_identity(name, p)), None)
+            if primary:
+                self._aliases.setdefault(primary, []).append(name)
+                continue
+            match = self.reuse_stored and best_match(name, self.db.block_candidates(name, REUSE_STATUSES))
+            stored = match and self.db.get_records([match[0]])[match[0]]
+            # An NPI on the line must also agree with the one the stored record found
+            if stored and line_npi(name) and profile_npi(stored["profile"]) not in (None, line_npi(name)):
+                stored = None
+            if stored:
+                details = {k: v for k, v in stored["details"].items() if k != "duplicate_of"}
+                if match[0] != name: details["served_from"] = match[0]
+                self.db.upsert_doctor(name, stored["status"], stored["initial_score"], stored["final_score"],
+                                      stored["profile"], details)
+                METRICS.inc("served_from_store")
+                note = "already" if match[0] == name else f"same doctor as {match[0]} ({match[2]}%),"
+                served.append(doctor(name, stored["status"], f"♻️ {name}: {note} {stored['status']} in the store", 1))
+                continue
+            if key: primaries.setdefault(key, []).append(name)
+            remaining.append((i, name))
+        return remaining, served
+
+    async def _settle(self, events, name, status, init_score, final_score, profile, details, stage):
+        """Stores a record and mirrors it to this batch's other spellings of the same doctor."""
+        self.db.upsert_doctor(name, status, init_score, final_score, profile, details)
+        for alias in self._aliases.get(name, ()):
+            self.db.upsert_doctor(alias, status, init_score, final_score, profile, {**details, "duplicate_of": name})
+            if status in DONE_STATUSES:
+                METRICS.inc("duplicates_merged")
+                await events.put(doctor(alias, status, f"🔁 {alias}: same doctor as {name} -> {status}", stage))
+
+    # --- STAGE 1: DISCOVERY ---
+    async def _discover(self, jobs, score_q, events, total, crawler, stealth, limiter):
+        """
+        Pulls names off the shared job queue until it is empty.
+        Every message goes through `events` so run() stays the only yielder.
+        """
+        while not self.stop_signal:
+            try:
+                i, name = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await events.put(doctor(name, "Scraping", f"🔎 [{i+1}/{total}] Scraping: {name}", 1))
+            started = time.time()
+            try:
+                profiles = await process_doctor(name, i+1, total, crawler, stealth, limiter)
+            except Exception as e:
+                METRICS.observe("doctor_stage", time.time() - started, stage="discover", outcome="error")
+                await events.put(doctor(name, "Error", f"❌ Error ({name}): {e}", 1, time.time() - started))
+                continue
+            METRICS.observe("doctor_stage", time.time() - started, stage="discover",
+                            outcome="found" if profiles else "not_found")
+            if profiles:
+                # Every matched source, folded into the best one
+                best = merge_profiles(profiles)
+                if self.check_assets and best.get("assets"):
+                    await self._verify_assets(name, best, events)
+                await self._settle(events, name, "Pending", 0, 0, best, {}, 1)
+                await events.put(doctor(name, "Scraped", f"📥 Scraped: {name}", 1, time.time() - started))
+                await score_q.put((name, best))
+            else:
+                METRICS.inc("doctors", status="Failed")
+                await events.put(doctor(name, "Failed", f"⚠️ No data found for {name}", 1, time.time() - started))
+                await self._settle(events, name, "Failed", 0, 0, {}, {}, 1)
+
+    async def _verify_assets(self, name, profile, events):
+        """Sets profile['verified_assets'] to the linked documents/images that name this doctor."""
+        with METRICS.timer("doctor_stage", stage="assets"):
+            try:
+                verified = await verify_assets(name, profile)
+            except Exception as e:
+                await events.put(log(f"   ⚠️ Asset check failed for {name}: {e}"))
+                return
+        if verified:
+            profile["verified_assets"] = verified
+            await events.put(log(f"   📜 {name}: {len(verified)} document(s) mention this doctor"))
+
+    # --- STAGE 2: SCORING ---
+    async def _score(self, score_q, enrich_q, events):
+        started = False
+        while True:
+            item = await score_q.get()
+            if item is None: return
+            if not started:
+                started = True
+                await events.put(phase(2))
+                await events.put(log("⚖️ --- PHASE 2: SCORING (streaming) ---"))
+            name, profile = item
+            npi = profile_npi(profile)
+            twins = self.db.find_by_npi(npi, REUSE_STATUSES, exclude=name) if npi else []
+            if twins:
+                # Same NPI already verified under another spelling: borrow its fields
+                profile = merge_profiles([profile, twins[0][2]])
+                METRICS.inc("npi_twins_merged")
+                await events.put(log(f"🔗 {name}: merged with stored {twins[0][0]} (same NPI)"))
+            with METRICS.timer("doctor_stage", stage="score"):
+                score, details = self.scorer.evaluate(profile)
+
+            if score >= VERIFY_THRESHOLD:
+                METRICS.inc("doctors", status="Verified")
+                await events.put(doctor(name, "Verified", f"✅ Verified: {name} ({int(score*100)}%)", 2))
+                await self._settle(events, name, "Verified", score, score, profile, details, 2)
+            else:
+                await events.put(doctor(name, "Queued", f"⚠️ Low Score: {name} ({int(score*100)}%) -> Queued", 2))
+                missing = self.missing_fields(details)
+                # Checkpoint so a restarted run can go straight to enrichment
+                await self._settle(events, name, "Queued", score, score, profile, {**details, "missing": missing}, 2)
+                await enrich_q.put(self._enrich_entry((name, profile, missing, score)))
+
+    # --- STAGE 3: ENRICHMENT ---
+    async def _enrich(self, enrich_q, events, crawler, stealth):
+        while True:
+            _, _, item = await enrich_q.get()
+            if item is None: return
+            if not self._enrich_started:
+                self._enrich_started = True
+                await events.put(phase(3))
+                await events.put(log("🧬 --- PHASE 3: ENRICHMENT (streaming) ---"))
+            name, profile, missing, init_score = item
+            if self._budget.exhausted():
+                # Out of capacity: leave it Queued so the next or resumed run hunts it
+                METRICS.inc("enrich_skipped", reason="budget")
+                _, details = self.scorer.evaluate(profile)
+                await events.put(doctor(name, "Deferred", f"⏳ Budget spent, deferred to the next run: {name}", 3))
+                await self._settle(events, name, "Queued", init_score, init_score, profile,
+                                   {**details, "missing": missing, "deferred": "enrichment budget"}, 3)
+                continue
+
+            hopeless = init_score + self.scorer.potential_gain(missing) < VERIFY_THRESHOLD
+            max_urls = HOPELESS_MAX_URLS if hopeless else HUNT_RESULTS
+            if hopeless: METRICS.inc("hunts_capped")
+            await events.put(doctor(name, "Enriching", f"📖 Deep Searching for {name}...", 3))
+            started = time.time()
+
+            try:
+                new_data = await self.enricher.hunt_text(name, missing, crawler, stealth,
+                                                         max_urls=max_urls, budget=self._budget)
+            except Exception as e:
+                METRICS.observe("doctor_stage", time.time() - started, stage="enrich", outcome="error")
+                await events.put(doctor(name, "Error", f"❌ Enrichment error ({name}): {e}", 3, time.time() - started))
+                continue
+
+            if new_data:
+                profile.update(new_data)
+                await events.put(log(f"   + Found: {list(new_data.keys())}"))
+
+            f_score, f_details = self.scorer.evaluate(profile)
+            status = "Enriched" if f_score >= VERIFY_THRESHOLD else "Manual_Review"
+            METRICS.observe("doctor_stage", time.time() - started, stage="enrich", outcome=status)
+            METRICS.inc("doctors", status=status)
+            await events.put(doctor(name, status, f"🏁 Final: {name} -> {int(f_score*100)}%", 3, time.time() - started))
+            await self._settle(events, name, status, init_score, f_score, profile, f_details, 3)
+
+    # --- STAGE WIRING ---
+    async def _drive(self, to_scrape, scraped_batch, pending_batch, events, total, crawler, stealth):
+        """
+        Starts every stage and closes each queue once all of its producers
+        are done, so stages drain and exit in order.
+        """
+        jobs = asyncio.Queue()
+        for job in to_scrape: jobs.put_nowait(job)
+        score_q = asyncio.Queue(maxsize=SCORE_QUEUE_SIZE)
+        enrich_q = asyncio.PriorityQueue(maxsize=ENRICH_QUEUE_SIZE)
+        limiter = HostLimiter(self.per_host)
+        self._enrich_started = False
+        self._enrich_seq = itertools.count()
+        self._budget = HuntBudget(self.enrich_fetch_budget, self.enrich_time_budget)
+
+        async def seed(queue, items):
+            for item in items: await queue.put(item)
+
+        n_discover = max(1, min(self.workers, len(to_scrape)))
+        discoverers = [
+            asyncio.create_task(self._discover(jobs, score_q, events, total, crawler, stealth, limiter))
+            for _ in range(n_discover)
+        ]
+        discoverers.append(asyncio.create_task(seed(score_q, scraped_batch.items())))
+        scorer = asyncio.create_task(self._score(score_q, enrich_q, events))
+        enrich_seed = asyncio.create_task(seed(enrich_q, [self._enrich_entry(item) for item in pending_batch]))
+        enrichers = [
+            asyncio.create_task(self._enrich(enrich_q, events, crawler, stealth))
+            for _ in range(max(1, self.enrich_workers))
+        ]
+
+        async def close_stages():
+            await asyncio.gather(*discoverers)
+            await score_q.put(None)
+            await asyncio.gather(scorer, enrich_seed)
+            for _ in enrichers: await enrich_q.put((_LAST, next(self._enrich_seq), None))
+            await asyncio.gather(*enrichers)
+
+        # A failed stage would leave its neighbours blocked on a queue; watch them all
+        tasks = [*discoverers, scorer, enrich_seed, *enrichers]
+        closer = asyncio.create_task(close_stages())
+        try:
+            done, _ = await asyncio.wait([*tasks, closer], return_when=asyncio.FIRST_EXCEPTION)
+            for t in done:
+                if not t.cancelled() and t.exception(): raise t.exception()
+        finally:
+            for t in [*tasks, closer]: t.cancel()
+            await asyncio.gather(*tasks, closer, return_exceptions=True)
+
+    async def run(self, doctor_list, resume: bool = False, run_id: Optional[int] = None):
+        """
+        With `resume`, progress already stored in the workflow DB is reused.
+        Pass the `run_id` of the interrupted run to continue its checkpoint.
+        """
         self.stop_signal = False
+        METRICS.reset()
+        routing_before = get_domain_stats().decisions.copy()   # Process-wide; reported per run
         total = len(doctor_list)
         scraped_batch = {}
         pending_batch = []
+        if run_id is None: run_id = self.db.start_run(doctor_list)
+
+        to_scrape = list(enumerate(doctor_list))
+        if resume:
+            to_scrape = self._restore(doctor_list, scraped_batch, pending_batch)
+            done = total - len(to_scrape) - len(scraped_batch) - len(pending_batch)
+            yield log(f"⏯ Resuming run #{run_id}: {done} done, {len(scraped_batch)} to score, "
+                      f"{len(pending_batch)} to enrich, {len(to_scrape)} to scrape")
+
+        # Block-index lookups hit SQLite once per name; keep them off the loop
+        to_scrape, served = await asyncio.to_thread(self._link, to_scrape)
+        yield phase(1)
+        for event in served: yield event
+        duplicates = sum(len(a) for a in self._aliases.values())
+        if served or duplicates:
+            yield log(f"♻️ {len(served)} served from the store, {duplicates} duplicate spellings folded into one scrape")
+        yield log(f"🚀 --- PHASE 1: DISCOVERY ({len(to_scrape)} profiles) ---")
 
-        # --- PHASE 1 ---
-        yield "PHASE:1"
-        yield f"🚀 --- PHASE 1: DISCOVERY ({total} profiles) ---"
-        
-        browser_conf = BrowserConfig(headless=True)
-        stealth = StealthBrowser()
-        await stealth.start()
-        
-        async with AsyncWebCrawler(config=browser_conf) as crawler:
-            for i, name in enumerate(doctor_list):
-                if self.stop_signal: break
-                yield f"🔎 [{i+1}/{total}] Scraping: {name}"
+        service = self.fetch_service or FetchService()
+        events = asyncio.Queue()
+        current_phase = 1
+        failed = False
+
+        try:
+            async with service.lease() as (crawler, stealth):
+                driver = asyncio.create_task(
+                    self._drive(to_scrape, scraped_batch, pending_batch, events, total, crawler, stealth)
+                )
                 try:
-                    profiles = await process_doctor(name, i+1, total, crawler, stealth)
-                    if profiles:
-                        best = profiles[0]
-                        scraped_batch[name] = best
-                        self.db.upsert_doctor(name, "Pending", 0, 0, best, {})
-                    else:
-                        yield f"⚠️ No data found for {name}"
-                        self.db.upsert_doctor(name, "Failed", 0, 0, {}, {})
-                except Exception as e:
-                    yield f"❌ Error: {e}"
-
-        # --- PHASE 2 ---
-        yield "PHASE:2"
-        yield f"⚖️ --- PHASE 2: SCORING ---"
-        
-        for name, profile in scraped_batch.items():
-            if self.stop_signal: break
-            score, details = self.scorer.evaluate(profile)
-            
-            if score >= 0.8:
-                yield f"✅ Verified: {name} ({int(score*100)}%)"
-                self.db.upsert_doctor(name, "Verified", score, score, profile, {})
-            else:
-                yield f"⚠️ Low Score: {name} ({int(score*100)}%) -> Queued"
-                missing = []
-                if not details.get('npi'): missing.append('npi_id')
-                if not details.get('license'): missing.append('license_id')
-                pending_batch.append((name, profile, missing))
-
-        # --- PHASE 3 ---
-        if pending_batch:
-            yield "PHASE:3"
-            yield f"🧬 --- PHASE 3: ENRICHMENT ({len(pending_batch)} records) ---"
-            
-            async with AsyncWebCrawler(config=browser_conf) as crawler:
-                for name, profile, missing in pending_batch:
-                    if self.stop_signal: break
-                    yield f"📖 Deep Searching for {name}..."
-                    
-                    # UPDATED CALL: Passing 'stealth' browser here
-                    new_data = await self.enricher.hunt_text(name, missing, crawler, stealth)
-                    
-                    if new_data:
-                        profile.update(new_data)
-                        yield f"   + Found: {list(new_data.keys())}"
-                    
-                    f_score, _ = self.scorer.evaluate(profile)
-                    status = "Enriched" if f_score >= 0.8 else "Manual_Review"
-                    yield f"🏁 Final: {name} -> {int(f_score*100)}%"
-                    self.db.upsert_doctor(name, status, 0, f_score, profile, {})
-
-        # Cleanup
-        await stealth.close()
-        yield "PHASE:4"
-        yield "✅ Pipeline Complete."
+                    while not (driver.done() and events.empty()):
+                        if self.stop_signal:
+                            yield log("🛑 Stop requested, cancelling in-flight work...")
+                            break
+                        try:
+                            msg = await asyncio.wait_for(events.get(), timeout=0.5)
+                        except asyncio.TimeoutError:
+                            continue
+                        if msg.kind == "phase":
+                            # Stages overlap; only ever move the progress bar forward
+                            if msg.phase <= current_phase: continue
+                            current_phase = msg.phase
+                        yield msg
+                    if driver.done() and not driver.cancelled() and driver.exception():
+                        failed = True
+                        yield log(f"❌ Pipeline error: {driver.exception()}")
+                finally:
+                    # Runs on stop and when the consumer abandons the generator
+                    driver.cancel()
+                    await asyncio.gather(driver, return_exceptions=True)
+        finally:
+            # A shared service keeps its browsers warm for the next run
+            if self.fetch_service is None: await service.close()
+
+        if self.stop_signal or failed:
+            self.db.flush()
+            yield log(f"⏸ Run #{run_id} interrupted; use RESUME LAST RUN to continue.")
+        else:
+            self.db.finish_run(run_id)
+        stats = get_domain_stats()
+        stats.save()
+        yield log(f"🧭 Fetch routing: {stats.report(since=routing_before)}")
+        yield log(f"⚡ Rule extraction: {fast_path_report()}")
+        llm, pages, searches = get_llm_cache(), get_page_cache(), get_search_cache()
+        yield log(f"💾 LLM cache: {_cache_lookups(llm)} ({llm.stats()['entries']} entries)")
+        yield log(f"💾 Page cache: {_cache_lookups(pages)} ({pages.stats()['bytes'] // 1024} KB)")
+        yield log(f"💾 Search cache: {_cache_lookups(searches)}")
+        yield log(f"⏱️ Slowest stages: {METRICS.summary()}")
+        try:
+            METRICS.write_report(PROFILE_JSON, PROFILE_CSV)
+            if self.prometheus_path:
+                with open(self.prometheus_path, "w") as f: f.write(METRICS.to_prometheus())
+            yield log(f"📊 Run profile written to {PROFILE_JSON} / {PROFILE_CSV}")
+        except OSError as e:
+            yield log(f"⚠️ Could not write run profile: {e}")
+        yield phase(4)
+        yield log("✅ Pipeline Complete.")
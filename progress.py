@@ -0,0 +1,79 @@
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+# --- CONFIGURATION ---
+LOG_BUFFER = 500          # Lines kept for the live terminal
+REFRESH_INTERVAL = 0.5    # Seconds between dashboard redraws
+
+# Statuses that mean a doctor has left the pipeline (Deferred ones stay Queued for the next run)
+FINAL_STATUSES = ("Verified", "Enriched", "Manual_Review", "Failed", "Error", "Deferred")
+
+@dataclass
+class ProgressEvent:
+    """
+    One structured update from RefineryPipeline.run.
+    kind is 'phase' (phase set), 'doctor' (doctor/status set) or 'log'.
+    str() gives the legacy text form ("PHASE:n" or the message).
+    """
+    kind: str
+    message: str = ""
+    doctor: Optional[str] = None
+    phase: Optional[int] = None
+    status: Optional[str] = None
+    seconds: Optional[float] = None
+    ts: float = field(default_factory=time.time)
+
+    def __str__(self):
+        return f"PHASE:{self.phase}" if self.kind == "phase" else self.message
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if v is not None and v != ""}
+
+def log(message: str) -> ProgressEvent:
+    return ProgressEvent("log", message)
+
+def phase(n: int) -> ProgressEvent:
+    return ProgressEvent("phase", phase=n)
+
+def doctor(name: str, status: str, message: str, phase: int, seconds: Optional[float] = None) -> ProgressEvent:
+    return ProgressEvent("doctor", message, doctor=name, phase=phase, status=status,
+                         seconds=round(seconds, 2) if seconds is not None else None)
+
+class ProgressTracker:
+    """
+    Consumer-side view of a run: a bounded ring buffer of terminal lines plus
+    live counters, so the UI can redraw on a timer instead of per event.
+    """
+    def __init__(self, max_lines: int = LOG_BUFFER):
+        self.lines = deque(maxlen=max_lines)
+        self.reset()
+
+    def reset(self):
+        self.status_counts = Counter()
+        self.phase = 0
+        self.finished = 0
+        self.stage_seconds = Counter()
+        self.started = time.time()
+
+    def clear_lines(self):
+        self.lines.clear()
+
+    def record(self, event: ProgressEvent):
+        if event.kind == "phase":
+            self.phase = event.phase
+        else:
+            self.lines.append(f"[{time.strftime('%H:%M:%S', time.localtime(event.ts))}] {event.message}")
+        if event.kind == "doctor":
+            self.status_counts[event.status] += 1
+            if event.status in FINAL_STATUSES: self.finished += 1
+            if event.seconds: self.stage_seconds[event.phase] += event.seconds
+
+    def tail(self, n: int = 20) -> List[str]:
+        return list(self.lines)[-n:]
+
+    def throughput(self) -> float:
+        """Doctors finished per minute since reset()."""
+        minutes = (time.time() - self.started) / 60
+        return self.finished / minutes if minutes > 0 else 0.0
@@ -0,0 +1,117 @@
+"""
+Bulk re-scoring of stored records with ConfidenceScorer, for when the
+weights or trusted sources change. Nothing is refetched: scorer inputs are
+read column-wise (json_extract in SQLite, or a JSONL dump of records), scored with
+ConfidenceScorer.evaluate_frame and only rows whose status moves are written.
+
+    python cli.py rescore                         # workflow.db in place
+    python cli.py rescore --jsonl records.jsonl --out changed.jsonl
+"""
+import json
+import time
+from collections import Counter
+from typing import Optional
+import numpy as np
+import pandas as pd
+from confidence_scorer import ConfidenceScorer, VERIFY_THRESHOLD
+from workflow_db import WorkflowDB, RESCORE_CHUNK
+
+# Statuses whose meaning depends on the score; Pending/Failed are left alone
+RESCORED_STATUSES = ("Verified", "Queued", "Enriched", "Manual_Review")
+DETAIL_KEYS = ("npi", "license", "source_trust", "assets_verified")
+
+def reclassify(status: np.ndarray, passed: np.ndarray) -> np.ndarray:
+    """
+    New status per row. Records that were never enriched move between
+    Verified and Queued (so a later run hunts them), enriched ones between
+    Enriched and Manual_Review.
+    """
+    return np.select(
+        [(status == "Verified") & ~passed, (status == "Queued") & passed,
+         (status == "Enriched") & ~passed, (status == "Manual_Review") & passed],
+        ["Queued", "Verified", "Manual_Review", "Enriched"],
+        default=status,
+    ).astype(object)
+
+def details_patch(row, new_status: str) -> str:
+    """JSON merge patch for a changed row: fresh score flags, `missing` only while Queued."""
+    patch = {k: True if row[k] else None for k in DETAIL_KEYS}
+    missing = [f for f, k in (("npi_id", "npi"), ("license_id", "license")) if not row[k]]
+    patch["missing"] = missing if new_status == "Queued" else None
+    patch["deferred"] = None
+    return json.dumps(patch)
+
+def rescore_frame(frame: pd.DataFrame, scorer: ConfidenceScorer, threshold: float = VERIFY_THRESHOLD) -> pd.DataFrame:
+    """Scores `frame` (scorer input columns + status) and adds new_status / changed."""
+    scored = scorer.evaluate_frame(frame)
+    status = frame["status"].to_numpy(dtype=object)
+    scored["status"] = status
+    scored["new_status"] = reclassify(status, scored["score"].to_numpy() >= threshold)
+    scored["changed"] = scored["new_status"] != scored["status"]
+    return scored
+
+def rescore_db(db: WorkflowDB, scorer: Optional[ConfidenceScorer] = None, threshold: float = VERIFY_THRESHOLD,
+               dry_run: bool = False, chunksize: int = RESCORE_CHUNK) -> dict:
+    """Re-scores every stored record in place; returns counts of status transitions."""
+    scorer = scorer or ConfidenceScorer()
+    started = time.time()
+    transitions, scanned, written = Counter(), 0, 0
+    for frame in db.scoring_frames(RESCORED_STATUSES, chunksize):
+        scanned += len(frame)
+        scored = rescore_frame(frame, scorer, threshold)
+        changed = scored[scored["changed"]]
+        if changed.empty: continue
+        names = frame.loc[changed.index, "name"]
+        transitions.update(f"{a}->{b}" for a, b in zip(changed["status"], changed["new_status"]))
+        if not dry_run:
+            written += db.apply_rescore([
+                (row.new_status, float(row.score), details_patch(row._asdict(), row.new_status), name)
+                for row, name in zip(changed.itertuples(), names)
+            ])
+    return {"scanned": scanned, "changed": sum(transitions.values()), "written": written,
+            "transitions": dict(transitions), "seconds": round(time.time() - started, 2)}
+
+def _jsonl_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Scorer input columns from {name, status, profile} records."""
+    profiles = chunk["profile"] if "profile" in chunk else pd.Series([{}] * len(chunk), index=chunk.index)
+    profiles = profiles.map(lambda p: p if isinstance(p, dict) else {})
+    frame = pd.DataFrame({
+        col: profiles.map(lambda p, c=col: p.get(c)) for col in ("npi_id", "npi", "license_id", "source_url")
+    }, index=chunk.index)
+    frame["verified_assets"] = profiles.map(lambda p: bool(p.get("verified_assets")))
+    frame["documents"] = profiles.map(lambda p: len((p.get("assets") or {}).get("documents") or []))
+    frame["status"] = chunk["status"]
+    return frame
+
+def _check_records(chunk: pd.DataFrame, path: str):
+    """Rejects JSONL that is not {name, status, profile} records, e.g. a `cli.py export` file."""
+    if "status" in chunk and "profile" in chunk: return
+    if "validation_result" in chunk:
+        raise ValueError(f"{path} is a final_enriched_v2 export ({{input_info, validation_result}}); it keeps "
+                         "no status or profile to re-score. Re-score the workflow DB instead (omit --jsonl).")
+    raise ValueError(f"{path} needs {{name, status, profile}} records, found fields: {', '.join(map(str, chunk.columns))}")
+
+def rescore_jsonl(path: str, out_path: str, scorer: Optional[ConfidenceScorer] = None,
+                  threshold: float = VERIFY_THRESHOLD, chunksize: int = RESCORE_CHUNK) -> dict:
+    """
+    Re-scores a JSONL dump of {name, status, profile, ...} records and
+    writes only the records whose status changed to `out_path`. Raises
+    ValueError for other shapes, such as the final_enriched_v2 export.
+    """
+    scorer = scorer or ConfidenceScorer()
+    started = time.time()
+    transitions, scanned = Counter(), 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        for chunk in pd.read_json(path, lines=True, chunksize=chunksize, dtype=False):
+            _check_records(chunk, path)
+            chunk = chunk[chunk["status"].isin(RESCORED_STATUSES)]
+            scanned += len(chunk)
+            if chunk.empty: continue
+            scored = rescore_frame(_jsonl_frame(chunk), scorer, threshold)
+            for idx, row in scored[scored["changed"]].iterrows():
+                transitions[f"{row['status']}->{row['new_status']}"] += 1
+                record = chunk.loc[idx].to_dict()
+                record.update(status=row["new_status"], previous_status=row["status"], final_score=float(row["score"]))
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    return {"scanned": scanned, "changed": sum(transitions.values()), "written": sum(transitions.values()),
+            "transitions": dict(transitions), "seconds": round(time.time() - started, 2)}
@@ -1,37 +1,165 @@
-import nodriver as uc
 import asyncio
-from typing import Optional
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# --- CONFIGURATION ---
+STEALTH_TABS = 3            # Tabs shared by concurrent stealth fetches
+STEALTH_TAB_MAX_USES = 25   # Recycle a tab after this many pages
+STEALTH_MAX_WAIT = 6        # Upper bound on waiting for a page to settle (s)
+STEALTH_IDLE_POLL = 0.25
+
+class HostLimiter:
+    """
+    Caps how many fetches may hit the same host at once.
+    """
+    def __init__(self, per_host: int = 2):
+        self.per_host = per_host
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    def slot(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc.lower()
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.per_host)
+        return self._slots[host]
 
 class StealthBrowser:
     """
     Helper to fetch raw HTML using Nodriver.
+    Keeps a pool of tabs that callers check out and return, recycles a tab
+    after `max_uses` fetches, and restarts Chrome if it stops responding.
     """
-    def __init__(self):
+    def __init__(self, tabs: int = STEALTH_TABS, max_uses: int = STEALTH_TAB_MAX_USES):
         self.browser = None
+        self.tabs = tabs
+        self.max_uses = max_uses
+        self._pool: Optional[asyncio.Queue] = None
+        self._generation = 0
+        self._start_lock = asyncio.Lock()
 
     async def start(self):
-        if not self.browser:
-            # We use headless=True. If debugging, set to False.
-            self.browser = await uc.start(
-                headless=True,
-                browser_args=["--no-sandbox", "--disable-setuid-sandbox", "--window-size=1920,1080"]
-            )
-            print("   🛡️  [Helper] Stealth Browser Started")
+        async with self._start_lock:
+            if self.browser: return
+            import nodriver as uc
+            if self._pool is None: self._pool = asyncio.Queue()
+            while not self._pool.empty(): self._pool.get_nowait() # Dead slots from a failed launch
+            try:
+                # We use headless=True. If debugging, set to False.
+                self.browser = await uc.start(
+                    headless=True,
+                    browser_args=["--no-sandbox", "--disable-setuid-sandbox", "--window-size=1920,1080"]
+                )
+                self._generation += 1
+                for _ in range(self.tabs):
+                    self._pool.put_nowait(await self._new_slot())
+            except Exception:
+                await self.close()
+                # Wake callers already waiting on the pool; they get None instead of hanging
+                self._pool.put_nowait({"tab": None, "uses": 0, "generation": self._generation})
+                raise
+            print(f"   🛡️  [Helper] Stealth Browser Started ({self.tabs} tabs)")
+
+    async def healthy(self) -> bool:
+        """True unless Chrome is running but no longer answers."""
+        return self.browser is None or await self._alive()
 
-    async def get_html(self, url: str, wait_time: int = 4) -> Optional[str]:
+    async def get_html(self, url: str, wait_time: float = STEALTH_MAX_WAIT, selector: Optional[str] = None) -> Optional[str]:
+        """
+        `wait_time` is an upper bound: the page is returned as soon as the
+        DOM settles (or `selector` shows up).
+        """
         if not self.browser: await self.start()
+        slot = await self._pool.get()
+        if slot["tab"] is None:
+            self._pool.put_nowait(slot) # Pass the wake-up on to the next waiter
+            return None
+        healthy = True
         try:
-            page = await self.browser.get(url)
-            await asyncio.sleep(wait_time) 
-            await page.scroll_down(200) # Trigger lazy loading
-            await asyncio.sleep(1)
-            content = await page.get_content()
-            return content
+            tab = slot["tab"]
+            await tab.get(url)
+            await self._wait_ready(tab, wait_time, selector)
+            await tab.scroll_down(200) # Trigger lazy loading
+            await self._wait_ready(tab, 1.5)
+            return await tab.get_content()
         except Exception as e:
             print(f"   ⚠️  [Helper] Fetch Error: {e}")
+            healthy = False
             return None
+        finally:
+            await self._checkin(slot, healthy)
+
+    # --- READINESS ---
+    async def _wait_ready(self, tab, timeout: float, selector: Optional[str] = None):
+        if selector:
+            try:
+                await tab.select(selector, timeout=timeout)
+                return
+            except Exception:
+                pass # Fall back to DOM idle
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        last_size, stable = -1, 0
+        while loop.time() < deadline:
+            probe = await tab.evaluate(
+                "document.readyState + '|' + (document.body ? document.body.innerHTML.length : 0)"
+            )
+            state, _, size = str(probe).partition("|")
+            if state == "complete" and size == last_size:
+                stable += 1
+                if stable >= 2: return
+            else:
+                stable = 0
+            last_size = size
+            await asyncio.sleep(STEALTH_IDLE_POLL)
+
+    # --- POOL MANAGEMENT ---
+    async def _new_slot(self) -> dict:
+        tab = await self.browser.get("about:blank", new_tab=True)
+        return {"tab": tab, "uses": 0, "generation": self._generation}
+
+    async def _checkin(self, slot: dict, healthy: bool):
+        if slot["generation"] != self._generation:
+            return # Tab belonged to a browser that has since been restarted
+        slot["uses"] += 1
+        if not healthy and not await self._alive():
+            await self._restart(slot["generation"])
+            return
+        if not healthy or slot["uses"] >= self.max_uses:
+            await self._close_tab(slot["tab"])
+            try:
+                slot = await self._new_slot()
+            except Exception:
+                await self._restart(slot["generation"])
+                return
+        self._pool.put_nowait(slot)
+
+    async def _alive(self) -> bool:
+        try:
+            await asyncio.wait_for(self.browser.main_tab.evaluate("1"), timeout=3)
+            return True
+        except Exception:
+            return False
+
+    async def _restart(self, generation: int):
+        if generation != self._generation: return # Another caller already restarted it
+        print("   🛡️  [Helper] Browser unresponsive, restarting...")
+        await self.close()
+        try:
+            await self.start()
+        except Exception as e:
+            print(f"   ⚠️  [Helper] Restart failed: {e}")
+
+    @staticmethod
+    async def _close_tab(tab):
+        try:
+            await tab.close()
+        except Exception:
+            pass
 
     async def close(self):
+        if self._pool:
+            while not self._pool.empty():
+                tab = self._pool.get_nowait()["tab"]
+                if tab: await self._close_tab(tab)
         if self.browser:
             try:
                 # !!! FIX: stop() is synchronous in some versions, do not await it
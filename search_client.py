@@ -0,0 +1,75 @@
+import asyncio
+import time
+import weakref
+from typing import Dict, List
+from cache_store import get_search_cache, SEARCH_TTL
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+SEARCH_RATE = 1.0   # Sustained searches per second
+SEARCH_BURST = 3    # Searches allowed back-to-back before throttling kicks in
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class TokenBucket:
+    def __init__(self, rate: float = SEARCH_RATE, burst: int = SEARCH_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class SearchClient:
+    """
+    DDGS text search behind a TTL cache, a token-bucket rate limiter and
+    request collapsing: identical in-flight queries share one request.
+    """
+    def __init__(self, rate: float = SEARCH_RATE, burst: int = SEARCH_BURST):
+        self.bucket = TokenBucket(rate, burst)
+        self.cache = get_search_cache()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def text(self, query: str, max_results: int = 3) -> List[dict]:
+        key = normalize_query(query)
+        cached = self.cache.get(key)
+        # A cached search with at least as many results can serve a smaller request
+        if cached and cached["max_results"] >= max_results:
+            return cached["results"][:max_results]
+
+        task = self._inflight.get(key)
+        if task is None or task.max_results < max_results:
+            task = asyncio.ensure_future(self._search(key, query, max_results))
+            task.max_results = max_results
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        results = await asyncio.shield(task)
+        return results[:max_results]
+
+    async def _search(self, key: str, query: str, max_results: int) -> List[dict]:
+        from ddgs import DDGS
+        await self.bucket.acquire()
+        # DDGS is synchronous; keep it off the event loop
+        with METRICS.timer("search_api"):
+            results = await asyncio.to_thread(lambda: list(DDGS().text(query, max_results=max_results)))
+        self.cache.put(key, {"max_results": max_results, "results": results}, ttl=SEARCH_TTL)
+        return results
+
+# --- SHARED INSTANCE ---
+_CLIENTS = weakref.WeakKeyDictionary()
+
+def get_search_client() -> SearchClient:
+    loop = asyncio.get_running_loop()
+    if loop not in _CLIENTS: _CLIENTS[loop] = SearchClient()
+    return _CLIENTS[loop]
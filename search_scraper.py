@@ -1,30 +1,58 @@
 import asyncio
-import json
 import os
+import re
 import time
-from typing import Dict, List, Optional
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from ddgs import DDGS
-from openai import OpenAI
+import weakref
+from typing import TYPE_CHECKING, Optional
 from thefuzz import fuzz
 
 # --- LIBRARIES ---
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
-from scraper_helper import StealthBrowser
+from scraper_helper import HostLimiter, StealthBrowser
+from llm_client import get_llm_client
+from search_client import get_search_client
+from domain_stats import get_domain_stats, domain_of
+from metrics import METRICS
+from html_prep import prepare_page
+from field_extractor import extract_for, missing_after, FAST_PATH_REQUIRED
+from text_window import window_text, PROFILE_TOKEN_BUDGET
+from cache_store import content_key, get_llm_cache, get_page_cache, normalize_url, page_ttl
+# crawl4ai pulls in Playwright; it is imported on first fetch (see fetch_service)
+if TYPE_CHECKING:
+    from crawl4ai import AsyncWebCrawler
 
 # --- CONFIGURATION ---
 INPUT_FILE = "doctor_names.txt"
 OUTPUT_FILE = "doctors_database_v2.json"
-BATCH_SIZE = 5
+BATCH_SIZE = 5          # Doctors processed concurrently in Phase 1
+PER_HOST_LIMIT = 2      # Concurrent fetches allowed against a single host
 MATCH_THRESHOLD = 70
-LLM_API_URL = "http://localhost:8080/v1"
+PROFILE_PROMPT_VERSION = 2  # Bump whenever the profile prompt changes (invalidates the LLM cache)
+EARLY_EXIT_SCORE = 90   # Fuzz score that, with a valid NPI, ends a doctor's scrape early
 GLOBAL_START_TIME = 0
 
+PROFILE_FIELDS = {
+    "name": "string, full name",
+    "npi_id": "string, 10-digit US ID, else 'N/A'",
+    "license_id": "string",
+    "speciality": "string",
+    "email": "string, or 'N/A'",
+    "phone_no": "string, clinic phone or 'N/A'",
+    "address": "string, full clinic address",
+    "age": "string, estimate if mentioned, else 'N/A'",
+    "hospital_affiliation": "string, main hospital",
+    "education": "string, degree/university",
+    "years_experience": "string",
+    "languages": "list of strings",
+    "summary": "string, max 50 words",
+}
+
 # --- VISUALS ---
 class StepTimer:
-    def __init__(self, step_name):
+    """Console timing block; with `metric`, the duration also goes to METRICS."""
+    def __init__(self, step_name, metric=None, **labels):
         self.step_name = step_name
+        self.metric = metric
+        self.labels = labels
         self.start_time = 0
     def __enter__(self):
         self.start_time = time.time()
@@ -34,6 +62,8 @@ class StepTimer:
         return self
     def __exit__(self, exc_type, exc_val, exc_tb):
         duration = time.time() - self.start_time
+        if self.metric:
+            METRICS.observe(self.metric, duration, outcome="error" if exc_type else "ok", **self.labels)
         if exc_type:
             print(f"│ ❌ ERROR: {exc_val}")
             print(f"└────────────────────────────────────────── [FAILED]")
@@ -41,88 +71,136 @@ class StepTimer:
             print(f"└────────────────────────────────────────── [COMPLETED in {duration:.2f}s]")
         return False
 
-# --- ASSET EXTRACTOR ---
-def extract_important_assets(html_content: str, base_url: str) -> Dict[str, List[str]]:
-    if not html_content or not isinstance(html_content, str): return {"documents": [], "images": []}
-    soup = BeautifulSoup(html_content, 'html.parser')
-    assets = {"documents": [], "images": []}
-    
-    for link in soup.find_all('a', href=True):
-        href = link['href'].lower()
-        if href.endswith(('.pdf', '.doc', '.docx')):
-            assets["documents"].append(urljoin(base_url, link['href']))
-            
-    for img in soup.find_all('img', src=True):
-        alt = img.get('alt', '').lower()
-        if any(k in alt for k in ['cert', 'award', 'license', 'board']):
-             assets["images"].append(urljoin(base_url, img['src']))
-        
-    return {k: list(set(v)) for k, v in assets.items()}
-
 # --- LLM PARSER ---
-def parse_with_local_llm(html: str, query_name: str) -> dict:
-    if not html or not isinstance(html, str): return {}
-    
-    soup = BeautifulSoup(html, 'html.parser')
-    for x in soup(["script", "style", "nav", "footer", "svg"]): x.decompose()
-    text = soup.get_text(separator=' ', strip=True)[:6500] 
+async def parse_with_local_llm(text: str, query_name: str, fields=None) -> Optional[dict]:
+    """
+    `text` is the cleaned page text from html_prep.prepare_page.
+    `fields` limits the request to a subset of PROFILE_FIELDS.
+    Returns None if the LLM call itself failed.
+    """
+    if not text: return {}
+    fields = list(fields or PROFILE_FIELDS)
+    text = window_text(text, query_name, PROFILE_TOKEN_BUDGET)
 
-    client = OpenAI(base_url=LLM_API_URL, api_key="sk-none")
-    
+    # The prompt names the doctor, so the name is part of the request too
+    cache = get_llm_cache()
+    key = content_key(text, "profile", PROFILE_PROMPT_VERSION, query_name, fields)
+    cached = cache.get(key)
+    if cached is not None:
+        print("│ 💾 LLM cache hit")
+        return cached
+
+    field_lines = "".join(f"- {f} ({PROFILE_FIELDS[f]})\n" for f in fields)
     prompt = (
         f"Extract doctor profile for: '{query_name}'.\n"
         f"Return STRICT JSON with these fields:\n"
-        f"- name (string, full name)\n"
-        f"- npi_id (string, 10-digit US ID, else 'N/A')\n"
-        f"- license_id (string)\n"
-        f"- speciality (string)\n"
-        f"- email (string, or 'N/A')\n"
-        f"- phone_no (string, clinic phone or 'N/A')\n"
-        f"- address (string, full clinic address)\n"
-        f"- age (string, estimate if mentioned, else 'N/A')\n"
-        f"- hospital_affiliation (string, main hospital)\n"
-        f"- education (string, degree/university)\n"
-        f"- years_experience (string)\n"
-        f"- languages (list of strings)\n"
-        f"- summary (string, max 50 words)\n\n"
+        f"{field_lines}\n"
         f"Source Text:\n{text}"
     )
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a JSON extractor. Output ONLY JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1
+        data = await get_llm_client().complete_json(
+            prompt, system="You are a JSON extractor. Output ONLY JSON."
         )
-        content = response.choices[0].message.content
-        if "```json" in content: content = content.split("```json")[1].split("```")[0]
-        elif "```" in content: content = content.split("```")[1].split("```")[0]
-        return json.loads(content)
+        cache.put(key, data)
+        return data
     except Exception as e:
         print(f"│ ⚠️  LLM Parse Error: {e}")
-        return {}
+        return None
 
 # --- SMART FETCHER ---
-async def smart_fetch(url: str, standard_crawler: AsyncWebCrawler, stealth_browser: StealthBrowser) -> Optional[str]:
-    # TIER 1: Standard
-    try:
-        run_conf = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, page_timeout=15000)
-        result = await standard_crawler.arun(url=url, config=run_conf)
-        
-        html = result.html or ""
-        # Basic junk check
-        if result.success and len(html) > 500:
-            print("│ ⚡ Method: Standard Crawler (Fast)")
-            return html
-    except Exception:
-        pass
+# Concurrent requests for the same page share one render (per event loop).
+# Maps normalised URL -> [task, waiter_count]; the render is cancelled (and
+# forgotten, so later callers start afresh) once every waiter has gone away.
+_INFLIGHT = weakref.WeakKeyDictionary()
+BLOCK_MARKERS = ("captcha", "access denied", "are you a robot", "unusual traffic", "verify you are human")
+
+def is_usable_page(html: Optional[str]) -> bool:
+    """Basic junk check: long enough, and the head is not a block/captcha page."""
+    if not html or len(html) <= 500: return False
+    head = html[:3000].lower()
+    return not any(marker in head for marker in BLOCK_MARKERS)
+
+async def smart_fetch(url: str, standard_crawler: "AsyncWebCrawler", stealth_browser: StealthBrowser,
+                      host_limiter: Optional[HostLimiter] = None) -> Optional[str]:
+    key = normalize_url(url)
+    html = get_page_cache().get(key)
+    if html:
+        print("│ 💾 Method: Page Cache")
+        return html
+
+    inflight = _INFLIGHT.setdefault(asyncio.get_running_loop(), {})
+    while True:
+        entry = inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(_fetch_and_store(key, url, standard_crawler, stealth_browser, host_limiter))
+            entry = inflight[key] = [task, 0]
+            task.add_done_callback(lambda _, entry=entry: _forget(inflight, key, entry))
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            # The shared render was cancelled under us, not this caller: fetch again
+            if entry[0].cancelled() and not _cancel_requested(): continue
+            raise
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+                _forget(inflight, key, entry)
+
+def _forget(inflight: dict, key: str, entry: list):
+    if inflight.get(key) is entry: del inflight[key]
+
+def _cancel_requested() -> bool:
+    task = asyncio.current_task()
+    cancelling = getattr(task, "cancelling", None)  # Python 3.11+
+    return bool(cancelling and cancelling())
+
+async def _fetch_and_store(key: str, url: str, standard_crawler: "AsyncWebCrawler", stealth_browser: StealthBrowser,
+                           host_limiter: Optional[HostLimiter] = None) -> Optional[str]:
+    html = await _fetch_tiers(url, standard_crawler, stealth_browser, host_limiter)
+    if is_usable_page(html): get_page_cache().put(key, html, ttl=page_ttl(url))
+    return html
+
+async def _fetch_tiers(url: str, standard_crawler: "AsyncWebCrawler", stealth_browser: StealthBrowser,
+                       host_limiter: Optional[HostLimiter] = None) -> Optional[str]:
+    if host_limiter:
+        async with host_limiter.slot(url):
+            return await _fetch_tiers(url, standard_crawler, stealth_browser)
+
+    stats = get_domain_stats()
+    tiers = stats.tiers_for(url)
+    if tiers[0] == "stealth": print("│ 🧭 Routing: domain blocks the standard crawler, going stealth")
+
+    # TIER 1: Standard (our page cache replaces crawl4ai's)
+    if "standard" in tiers:
+        started = time.time()
+        try:
+            from crawl4ai import CrawlerRunConfig, CacheMode
+            run_conf = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, page_timeout=15000)
+            result = await standard_crawler.arun(url=url, config=run_conf)
+            
+            html = result.html or ""
+            ok = result.success and is_usable_page(html)
+            elapsed = time.time() - started
+            stats.record_fetch(url, "standard", ok, elapsed, blocked=not ok)
+            record_fetch_timing("standard", url, elapsed, ok)
+            if ok:
+                print("│ ⚡ Method: Standard Crawler (Fast)")
+                return html
+        except Exception:
+            stats.record_fetch(url, "standard", False, time.time() - started)
+            record_fetch_timing("standard", url, time.time() - started, False)
+        METRICS.inc("fallbacks", kind="stealth")
 
     # TIER 2: Nodriver (Stealth)
     print("│ 🛡️  Method: Nodriver (Stealth)")
+    started = time.time()
     html = await stealth_browser.get_html(url)
+    ok = is_usable_page(html)
+    stats.record_fetch(url, "stealth", ok, time.time() - started, blocked=bool(html) and not ok)
+    record_fetch_timing("stealth", url, time.time() - started, ok)
     
     # !!! ESSENTIAL FIX: Return RAW HTML string, NOT a dictionary !!!
     if html:
@@ -130,51 +208,113 @@ async def smart_fetch(url: str, standard_crawler: AsyncWebCrawler, stealth_brows
     
     return None
 
+def record_fetch_timing(tier: str, url: str, seconds: float, ok: bool):
+    METRICS.observe("fetch", seconds, tier=tier, outcome="ok" if ok else "fail")
+    METRICS.observe("fetch_by_domain", seconds, tier=tier, domain=domain_of(url))
+
 # --- PROCESSOR ---
-async def process_doctor(line_str, index, total, standard_crawler, stealth_browser):
+def is_strong_match(profile: dict, score: int) -> bool:
+    """A near-certain name match that also carries a 10-digit NPI."""
+    npi = re.sub(r'\D', '', str(profile.get('npi_id', '')))
+    return score >= EARLY_EXIT_SCORE and len(npi) == 10
+
+async def scrape_link(i, url, name_query, standard_crawler, stealth_browser, host_limiter=None):
+    """
+    Fetch + extract a single search result.
+    Returns (rank, score, profile) for a match, else None.
+    """
+    with StepTimer(f"Scraping Link {i+1}", metric="scrape_link"):
+        print(f"│ 🔗 URL: {url}")
+        html = await smart_fetch(url, standard_crawler, stealth_browser, host_limiter)
+        
+        if not html:
+            print("│ ❌ Failed to fetch content.")
+            return None
+
+        # A. Parse once: assets + cleaned text
+        page = await prepare_page(html, url)
+        assets = page.assets
+        if assets['documents']: print(f"│ 📂 Found {len(assets['documents'])} Docs")
+        
+        # B. Extract Profile: rules first (near the doctor's name only), LLM for what they missed
+        profile = extract_for(name_query, page.text, page.hints, url)
+        METRICS.inc("rule_fields", len(profile), stage="discover")
+        if profile.get('name') and not missing_after(profile, FAST_PATH_REQUIRED):
+            METRICS.inc("extraction", path="rules", stage="discover")
+            print(f"│ ⚡ Fast path: {sorted(profile)} found by rules, skipping LLM")
+        else:
+            METRICS.inc("extraction", path="llm", stage="discover")
+            print("│ 🧠 Extracting with Local AI...")
+            # Headings are too loose to trust on their own, so the LLM always names the doctor
+            rules = {k: v for k, v in profile.items() if k != 'name'}
+            llm_profile = await parse_with_local_llm(page.text, name_query, ['name'] + missing_after(rules, PROFILE_FIELDS))
+            if llm_profile is None:
+                # Says nothing about the domain, so it is not recorded against it
+                METRICS.inc("matches", result="llm_error")
+                return None
+            # Validated rule values win over the model's
+            profile = {**llm_profile, **rules} if llm_profile else {}
+        
+        if profile and profile.get('name'):
+            score = fuzz.token_set_ratio(name_query, profile['name'])
+            if score >= MATCH_THRESHOLD:
+                profile['source_url'] = url
+                profile['assets'] = assets
+                get_domain_stats().record_outcome(url, matched=True)
+                METRICS.inc("matches", result="match")
+                print(f"│ ✅ MATCH ({score}%): {profile['name']}")
+                return i, score, profile
+            print(f"│ ⚠️  Mismatch ({score}%): Got '{profile['name']}'")
+            METRICS.inc("matches", result="mismatch")
+        else:
+            METRICS.inc("matches", result="no_profile")
+        get_domain_stats().record_outcome(url, matched=False)
+        return None
+
+async def process_doctor(line_str, index, total, standard_crawler, stealth_browser, host_limiter=None):
     print(f"\n{'='*70}")
     print(f"😷 PROCESSING [ {index}/{total} ] : {line_str}")
     print(f"{'='*70}")
     
     parts = [p.strip() for p in line_str.split(",")]
     name_query = parts[0]
-    entries = []
+    matches = []
 
     # 1. Search
     urls = []
-    with StepTimer(f"Searching Web"):
-        ddgs = DDGS()
+    with StepTimer(f"Searching Web", metric="search"):
         try:
-            results = list(ddgs.text(f"{line_str} profile", max_results=3))
+            results = await get_search_client().text(f"{line_str} profile", max_results=3)
             urls = [r['href'] for r in results if "instagram" not in r['href']]
             print(f"│ 🔍 Found {len(urls)} links")
+            dead = [u for u in urls if get_domain_stats().should_skip(u)]
+            if dead:
+                print(f"│ 🧭 Routing: skipping {len(dead)} link(s) from domains that never match")
+                urls = [u for u in urls if u not in dead]
         except: print("│ ⚠️ Search failed.")
 
-    # 2. Hybrid Scrape
-    for i, url in enumerate(urls):
-        with StepTimer(f"Scraping Link {i+1}"):
-            print(f"│ 🔗 URL: {url}")
-            html = await smart_fetch(url, standard_crawler, stealth_browser)
-            
-            if html:
-                # A. Extract Assets
-                assets = extract_important_assets(html, url)
-                if assets['documents']: print(f"│ 📂 Found {len(assets['documents'])} Docs")
-                
-                # B. Extract Profile
-                print("│ 🧠 Extracting with Local AI...")
-                profile = parse_with_local_llm(html, name_query)
-                
-                if profile and profile.get('name'):
-                    score = fuzz.token_set_ratio(name_query, profile['name'])
-                    if score >= MATCH_THRESHOLD:
-                        profile['source_url'] = url
-                        profile['assets'] = assets
-                        entries.append(profile)
-                        print(f"│ ✅ MATCH ({score}%): {profile['name']}")
-                    else:
-                        print(f"│ ⚠️  Mismatch ({score}%): Got '{profile['name']}'")
-            else:
-                print("│ ❌ Failed to fetch content.")
-
-    return entries
+    # 2. Hybrid Scrape (all links at once, stop early on a strong match)
+    tasks = [
+        asyncio.create_task(scrape_link(i, url, name_query, standard_crawler, stealth_browser, host_limiter))
+        for i, url in enumerate(urls)
+    ]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                hit = await fut
+            except Exception as e:
+                print(f"│ ⚠️  Link Error: {e}")
+                continue
+            if not hit: continue
+            matches.append(hit)
+            if is_strong_match(hit[2], hit[1]):
+                METRICS.inc("early_exits")
+                print(f"│ 🎯 Strong match, skipping {sum(not t.done() for t in tasks)} remaining link(s)")
+                break
+    finally:
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Strong matches first, then search rank (callers take entries[0])
+    matches.sort(key=lambda m: (not is_strong_match(m[2], m[1]), m[0]))
+    return [profile for _, _, profile in matches]
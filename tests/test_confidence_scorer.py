@@ -0,0 +1,55 @@
+import json
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("numpy")
+
+from confidence_scorer import ConfidenceScorer
+from exporter import to_record
+from rescore import _jsonl_frame, rescore_jsonl
+from workflow_db import WorkflowDB
+
+PROFILES = [
+    {"npi_id": 1234567893, "license_id": [], "source_url": "https://npidb.org/x"},
+    {"npi_id": None, "npi": "1234567893", "license_id": {}, "source_url": None},
+    {"npi_id": "", "npi": 1245319599, "license_id": "N/A", "verified_assets": ["a.pdf"]},
+    {"npi_id": [], "license_id": 12345, "assets": {"documents": ["cv.pdf"]}},
+    {"npi_id": "123-456-7893", "license_id": ["MD-1"], "assets": None},
+    {"license_id": 0, "verified_assets": False},
+    {},
+]
+COLUMNS = ["score", "npi", "license", "source_trust", "assets_verified"]
+
+
+def expected(scorer):
+    rows = []
+    for profile in PROFILES:
+        score, details = scorer.evaluate(profile)
+        rows.append([score, details.get("npi", False), details.get("license", False),
+                     details.get("source_trust", False), details.get("assets_verified", False)])
+    return rows
+
+
+def test_evaluate_frame_matches_evaluate_on_jsonl_rows():
+    scorer = ConfidenceScorer()
+    chunk = pd.DataFrame({"profile": PROFILES, "status": "Queued"})
+    got = scorer.evaluate_frame(_jsonl_frame(chunk))[COLUMNS].values.tolist()
+    assert got == expected(scorer)
+
+
+def test_evaluate_frame_matches_evaluate_on_stored_rows(tmp_path):
+    scorer = ConfidenceScorer()
+    db = WorkflowDB(str(tmp_path / "workflow.db"))
+    for i, profile in enumerate(PROFILES):
+        db.upsert_doctor(f"Doctor {i}", "Queued", 0, 0, profile, {})
+    frame = pd.concat(db.scoring_frames(("Queued",))).sort_values("name")
+    got = scorer.evaluate_frame(frame)[COLUMNS].values.tolist()
+    db.close()
+    assert got == expected(scorer)
+
+
+def test_rescore_jsonl_rejects_export_files(tmp_path):
+    export = tmp_path / "final_enriched.jsonl"
+    export.write_text(json.dumps(to_record("Dr. A", "Verified", 0.9, PROFILES[0])) + "\n")
+    with pytest.raises(ValueError, match="final_enriched_v2"):
+        rescore_jsonl(str(export), str(tmp_path / "changed.jsonl"))
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("thefuzz")
+
+from name_index import best_match, same_identity
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Dr.Nidhi Rawal,Pediatrics,Gurgaon", "Dr. Nidhi Rawal"),
+    ("STANFORD R. SCHWIMER, M.D.", "Stanford R. Schwimer"),
+    ("Stanford R. Schwimer, M.D.", "Stanford R. Schwimer, MD"),
+    ("Nidhi Rawal, Pediatrics, Gurgaon", "Nidhi Rawal, Pediatrics"),
+])
+def test_compatible_lines_match(a, b):
+    assert same_identity(a, b)
+    assert best_match(a, [(b, "Verified")]) is not None
+
+
+def test_conflicting_qualifiers_do_not_match():
+    a, b = "John Smith, Dermatology, TX", "John Smith, Cardiology, NY"
+    assert not same_identity(a, b)
+    assert best_match(a, [(b, "Verified")]) is None
+
+
+def test_conflicting_npis_do_not_match():
+    assert not same_identity("John Smith, 1234567893", "John Smith, 1245319599")
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+
+for dep in ("pandas", "numpy", "thefuzz", "bs4", "httpx"):
+    pytest.importorskip(dep)
+
+from pipeline_controller import RefineryPipeline, SCORE_QUEUE_SIZE
+
+
+def test_stage_failure_stops_the_run(tmp_path, monkeypatch):
+    pipeline = RefineryPipeline(db_path=str(tmp_path / "workflow.db"), check_assets=False)
+    pipeline._aliases = {}
+
+    def broken(profile):
+        raise ValueError("scorer exploded")
+    monkeypatch.setattr(pipeline.scorer, "evaluate", broken)
+
+    # More than the score queue holds, so the seeding discoverer blocks on put()
+    scraped = {f"Dr. Test {i}": {"name": f"Test {i}"} for i in range(SCORE_QUEUE_SIZE + 10)}
+    drive = pipeline._drive([], scraped, [], asyncio.Queue(), len(scraped), None, None)
+    with pytest.raises(ValueError, match="scorer exploded"):
+        asyncio.run(asyncio.wait_for(drive, timeout=5))
+    pipeline.db.close()
+
+
+def test_budget_deferred_records_stay_queued(tmp_path):
+    pipeline = RefineryPipeline(db_path=str(tmp_path / "workflow.db"), check_assets=False, enrich_fetch_budget=0)
+    pipeline._aliases = {}
+    pending = [("Dr. Test", {"name": "Test"}, ["npi_id", "license_id"], 0.2)]
+    events = asyncio.Queue()
+    asyncio.run(asyncio.wait_for(pipeline._drive([], {}, pending, events, 1, None, None), timeout=5))
+
+    record = pipeline.db.get_records(["Dr. Test"])["Dr. Test"]
+    assert record["status"] == "Queued"
+    assert record["details"]["deferred"] and record["details"]["missing"] == ["npi_id", "license_id"]
+    # A resumed run sends it straight back to enrichment
+    pending = []
+    assert pipeline._restore(["Dr. Test"], {}, pending) == [] and pending[0][0] == "Dr. Test"
+    pipeline.db.close()
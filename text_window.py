@@ -0,0 +1,104 @@
+import re
+from typing import List, Optional
+
+# --- CONFIGURATION ---
+CHUNK_CHARS = 400
+CHARS_PER_TOKEN = 4          # Rough estimate, good enough for budgeting
+PROFILE_TOKEN_BUDGET = 1200
+MISSING_TOKEN_BUDGET = 800
+JOINER = " … "
+NAME_SPAN = 40               # Chars around a name token the other tokens must fall in
+NEXT_PERSON = re.compile(r'\b(?:Dr|Doctor)\.?\s+[A-Z]')   # Where the next doctor's section starts
+
+TITLE_WORDS = {"dr", "doctor", "md", "m", "d", "mbbs", "ms", "mch", "dnb", "do", "prof", "phd", "frcs"}
+
+PATTERNS = {
+    "npi": re.compile(r'\bNPI\b|\b\d{10}\b', re.I),
+    "license": re.compile(r'\blicen[cs]e\b|\bregistration\b|\breg\.?\s*no\b|\bmedical council\b|\bboard certified\b', re.I),
+    "phone": re.compile(r'(?:\+?\d{1,3}[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b'),
+    "address": re.compile(
+        r'\b\d+\s+(?:[A-Za-z]+\s){0,4}(?:st|street|ave|avenue|rd|road|blvd|suite|ste|drive|lane|ln|way|sector|block)\b'
+        r'|\b[A-Z]{2}\s\d{5}(?:-\d{4})?\b|\b\d{6}\b',
+        re.I
+    ),
+}
+WEIGHTS = {"name": 5, "name_token": 2, "npi": 4, "license": 3, "phone": 2, "address": 2, "neighbour": 1}
+# Missing fields to pattern names they should boost during enrichment
+FOCUS = {"npi_id": "npi", "license_id": "license", "phone_no": "phone", "address": "address"}
+
+def name_tokens(name: str) -> List[str]:
+    words = re.findall(r'[a-z]+', name.lower())
+    return [w for w in words if w not in TITLE_WORDS and len(w) > 1]
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """Splits on sentence-ish boundaries into chunks of roughly `size` chars."""
+    chunks, current = [], ""
+    for piece in re.split(r'(?<=[.!?|])\s+', text):
+        if current and len(current) + len(piece) + 1 > size:
+            chunks.append(current)
+            current = ""
+        # Pieces with no sentence breaks get hard-split
+        while len(piece) > size:
+            chunks.append(piece[:size])
+            piece = piece[size:]
+        current = f"{current} {piece}" if current else piece
+    if current: chunks.append(current)
+    return chunks
+
+def name_sections(text: str, tokens: List[str], size: int = CHUNK_CHARS) -> str:
+    """
+    The text that follows each mention of the doctor (all `tokens` close
+    together), up to `size` chars or the next "Dr. X", joined with JOINER.
+    On listing pages this keeps other doctors' IDs away from rule extraction.
+    """
+    if not tokens: return ""
+    low = text.lower()
+    sections, end = [], -1
+    for m in re.finditer(r'\b(?:' + "|".join(map(re.escape, set(tokens))) + r')\b', low):
+        start = m.start()
+        if start < end: continue # Same mention
+        near = low[max(0, start - NAME_SPAN):start + NAME_SPAN]
+        if not all(re.search(r'\b' + re.escape(t) + r'\b', near) for t in tokens): continue
+        end = start + size
+        other = NEXT_PERSON.search(text, m.end(), end)
+        if other: end = other.start()
+        sections.append(text[start:end])
+    return JOINER.join(sections)
+
+def window_text(text: str, name: str, token_budget: int, focus: Optional[List[str]] = None) -> str:
+    """
+    Packs the chunks most relevant to the doctor into `token_budget`.
+    Chunks are ranked by how closely they mention the name, NPI/license
+    markers and phone/address patterns, then emitted in page order.
+    """
+    budget = token_budget * CHARS_PER_TOKEN
+    if len(text) <= budget: return text
+
+    chunks = chunk_text(text)
+    tokens = name_tokens(name)
+    full_name = " ".join(tokens)
+    boosted = {FOCUS[f] for f in (focus or []) if f in FOCUS}
+
+    scores = []
+    for chunk in chunks:
+        low = chunk.lower()
+        score = WEIGHTS["name"] if full_name and full_name in " ".join(re.findall(r'[a-z]+', low)) else 0
+        score += WEIGHTS["name_token"] * sum(1 for t in set(tokens) if t in low)
+        for kind, pattern in PATTERNS.items():
+            if pattern.search(chunk):
+                score += WEIGHTS[kind] * (2 if kind in boosted else 1)
+        scores.append(score)
+
+    # A doctor's section usually spans neighbouring chunks
+    has_name = [any(t in c.lower() for t in tokens) for c in chunks]
+    for i in range(len(chunks)):
+        if (i > 0 and has_name[i - 1]) or (i + 1 < len(chunks) and has_name[i + 1]):
+            scores[i] += WEIGHTS["neighbour"]
+
+    picked, used = [], 0
+    for i in sorted(range(len(chunks)), key=lambda i: (-scores[i], i)):
+        cost = len(chunks[i]) + len(JOINER)
+        if used + cost > budget: continue
+        picked.append(i)
+        used += cost
+    return JOINER.join(chunks[i] for i in sorted(picked))
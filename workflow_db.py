@@ -0,0 +1,435 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+import pandas as pd
+from name_index import block_keys, name_key, profile_npi
+
+# --- CONFIGURATION ---
+DB_PATH = "workflow.db"
+WRITE_BATCH = 200        # Max upserts committed in one transaction
+FLUSH_INTERVAL = 0.5     # Seconds the writer waits to fill a batch
+BUSY_TIMEOUT = 30        # Seconds a connection waits on another writer per attempt
+WRITE_RETRIES = 5        # Attempts per batch while another process holds the write lock
+RETRY_BACKOFF = 0.2      # Seconds before the first retry; doubles each time
+PAGE_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS doctors (
+    name TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    initial_score REAL DEFAULT 0,
+    final_score REAL DEFAULT 0,
+    profile TEXT DEFAULT '{}',
+    details TEXT DEFAULT '{}',
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_doctors_status ON doctors(status);
+CREATE INDEX IF NOT EXISTS idx_doctors_score ON doctors(final_score);
+CREATE INDEX IF NOT EXISTS idx_doctors_updated ON doctors(updated_at);
+CREATE TABLE IF NOT EXISTS name_blocks (
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (key, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS export_marks (
+    target TEXT PRIMARY KEY,
+    change_seq INTEGER NOT NULL,
+    exported_at REAL
+);
+CREATE TABLE IF NOT EXISTS change_counter (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO change_counter (id, seq) VALUES (0, 0);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doctors TEXT NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+"""
+# Added after the first release; older databases are migrated on open.
+# change_seq is stamped from change_counter inside the committing transaction,
+# so it grows in commit order across every process sharing the DB.
+ADDED_COLUMNS = {("doctors", "name_key"): "TEXT", ("doctors", "npi"): "TEXT",
+                 ("doctors", "change_seq"): "INTEGER"}
+ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_doctors_name_key ON doctors(name_key);
+CREATE INDEX IF NOT EXISTS idx_doctors_npi ON doctors(npi);
+CREATE INDEX IF NOT EXISTS idx_doctors_change ON doctors(change_seq);
+"""
+# Statuses a resumed run never touches again
+DONE_STATUSES = ("Verified", "Enriched", "Manual_Review", "Failed")
+
+# Columns shown on the dashboard; profile fields are pulled out with JSON1
+VIEW_COLUMNS = """
+    name, status, initial_score, final_score,
+    json_extract(profile, '$.npi_id') AS npi_id,
+    json_extract(profile, '$.license_id') AS license_id,
+    json_extract(profile, '$.phone_no') AS phone_no,
+    json_extract(profile, '$.source_url') AS source_url,
+    datetime(updated_at, 'unixepoch', 'localtime') AS updated
+"""
+
+# Scorer inputs pulled straight out of the stored profile JSON (see ConfidenceScorer.evaluate_frame)
+SCORING_COLUMNS = """
+    name, status, final_score,
+    NULLIF(NULLIF(json_extract(profile, '$.npi_id'), '[]'), '{}') AS npi_id,
+    NULLIF(NULLIF(json_extract(profile, '$.npi'), '[]'), '{}') AS npi,
+    NULLIF(NULLIF(json_extract(profile, '$.license_id'), '[]'), '{}') AS license_id,
+    json_extract(profile, '$.source_url') AS source_url,
+    CASE json_type(profile, '$.verified_assets')
+        WHEN 'array' THEN json_array_length(profile, '$.verified_assets') > 0
+        WHEN 'object' THEN json_extract(profile, '$.verified_assets') != '{}'
+        WHEN 'true' THEN 1
+        WHEN 'text' THEN json_extract(profile, '$.verified_assets') != ''
+        WHEN 'integer' THEN json_extract(profile, '$.verified_assets') != 0
+        ELSE 0 END AS verified_assets,
+    COALESCE(json_array_length(profile, '$.assets.documents'), 0) AS documents
+"""
+RESCORE_CHUNK = 50000
+EXPORT_CHUNK = 5000
+
+class WriteError(RuntimeError):
+    """Queued writes the writer could not commit; they stay queued and are retried."""
+
+class WorkflowDB:
+    """
+    SQLite store for pipeline records (workflow.db).
+    Writes go through a background thread that batches upserts into one
+    transaction per FLUSH_INTERVAL; reads use per-thread connections and
+    never wait on the writer thanks to WAL mode.
+    """
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for (table, col), kind in ADDED_COLUMNS.items():
+            cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+            if col not in cols: conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {kind}")
+        conn.executescript(ADDED_INDEXES)
+        conn.commit()
+        self._backfill_links(conn)
+        self._backfill_changes(conn)
+        self._queue = queue.Queue()
+        self._failed: Dict[str, tuple] = {}   # Rows of batches that could not be committed
+        self._error: Optional[Exception] = None
+        self._writer = threading.Thread(target=self._write_loop, name="WorkflowDB-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        """Read connection for the calling thread."""
+        if not hasattr(self._local, "conn"): self._local.conn = self._connect()
+        return self._local.conn
+
+    # --- WRITES ---
+    def upsert_doctor(self, name, status, initial_score, final_score, profile, details=None):
+        """Queues the write; call flush() when it must be visible to readers."""
+        self._queue.put(("upsert", (
+            name, status, float(initial_score or 0), float(final_score or 0),
+            json.dumps(profile or {}, ensure_ascii=False, default=str),
+            json.dumps(details or {}, ensure_ascii=False, default=str),
+            time.time(), name_key(name), profile_npi(profile)
+        )))
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Blocks until every write queued so far has been committed. Raises
+        WriteError if some could not be; they are retried on the next flush.
+        """
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+        failed, error = len(self._failed), self._error
+        if failed: raise WriteError(f"{failed} queued write(s) not saved to {self.path}: {error}")
+
+    def close(self):
+        """Commits what is queued and stops the writer; raises WriteError if writes were lost."""
+        try:
+            self.flush()
+        finally:
+            self._queue.put(("stop", None))
+            self._writer.join()
+
+    def clear_database(self):
+        self.flush()
+        conn = self._conn()
+        conn.execute("DELETE FROM doctors")
+        conn.execute("DELETE FROM runs")
+        conn.execute("DELETE FROM name_blocks")
+        conn.commit()
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection, n: int) -> int:
+        """Claims `n` change sequence numbers inside the caller's transaction; returns the first."""
+        conn.execute("UPDATE change_counter SET seq = seq + ? WHERE id = 0", (n,))
+        return conn.execute("SELECT seq FROM change_counter WHERE id = 0").fetchone()[0] - n + 1
+
+    # --- RUNS (checkpoints) ---
+    def start_run(self, doctors) -> int:
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO runs (doctors, started_at) VALUES (?, ?)",
+            (json.dumps(list(doctors), ensure_ascii=False), time.time())
+        )
+        conn.commit()
+        return cur.lastrowid
+
+    def finish_run(self, run_id: int):
+        self.flush()
+        conn = self._conn()
+        conn.execute("UPDATE runs SET finished_at=? WHERE id=?", (time.time(), run_id))
+        conn.commit()
+
+    def last_unfinished_run(self) -> Optional[tuple]:
+        """(run_id, doctor_list) of the newest run that never reached the end, if any."""
+        row = self._conn().execute(
+            "SELECT id, doctors FROM runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def get_records(self, names) -> Dict[str, dict]:
+        """Stored state for the given doctors, keyed by name."""
+        self.flush()
+        names = list(dict.fromkeys(names))
+        out = {}
+        for i in range(0, len(names), 500): # Stay under SQLite's bound-parameter limit
+            chunk = names[i:i+500]
+            rows = self._conn().execute(
+                f"SELECT name, status, initial_score, final_score, profile, details FROM doctors "
+                f"WHERE name IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for name, status, init, final, profile, details in rows:
+                out[name] = {
+                    "status": status, "initial_score": init, "final_score": final,
+                    "profile": json.loads(profile or "{}"), "details": json.loads(details or "{}"),
+                }
+        return out
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            items = [self._queue.get()]
+            deadline = time.time() + FLUSH_INTERVAL
+            while len(items) < WRITE_BATCH and items[-1][0] == "upsert":
+                try:
+                    items.append(self._queue.get(timeout=max(0, deadline - time.time())))
+                except queue.Empty:
+                    break
+
+            # Last write per doctor wins inside a batch, also over earlier failed rows
+            rows: Dict[str, tuple] = dict(self._failed)
+            for kind, payload in items:
+                if kind == "upsert": rows[payload[0]] = payload
+            if rows:
+                error = self._commit(conn, rows)
+                if error: print(f"   ⚠️  [DB] Failed to write {len(rows)} rows: {error}")
+                self._failed, self._error = (rows, error) if error else ({}, None)
+            for kind, payload in items:
+                if kind == "flush": payload.set()
+            if items[-1][0] == "stop":
+                conn.close()
+                return
+
+    def _commit(self, conn: sqlite3.Connection, rows: Dict[str, tuple]) -> Optional[Exception]:
+        """Writes one batch in a transaction, retrying while the DB is busy; returns the final error."""
+        for attempt in range(WRITE_RETRIES):
+            try:
+                with conn:
+                    first = self._next_seq(conn, len(rows))
+                    conn.executemany(
+                        "INSERT INTO doctors (name, status, initial_score, final_score, profile, details, "
+                        "updated_at, name_key, npi, change_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET status=excluded.status, "
+                        "initial_score=excluded.initial_score, final_score=excluded.final_score, "
+                        "profile=excluded.profile, details=excluded.details, updated_at=excluded.updated_at, "
+                        "name_key=excluded.name_key, npi=excluded.npi, change_seq=excluded.change_seq",
+                        [(*row, first + i) for i, row in enumerate(rows.values())]
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO name_blocks (key, name) VALUES (?, ?)",
+                        [(key, name) for name in rows for key in block_keys(name)]
+                    )
+                return None
+            except sqlite3.OperationalError as e:
+                busy = "locked" in str(e) or "busy" in str(e)
+                if not busy or attempt == WRITE_RETRIES - 1: return e
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            except Exception as e:
+                return e
+
+    # --- NAME / NPI INDEX ---
+    def _backfill_links(self, conn: sqlite3.Connection):
+        """Fills the linkage columns and blocks for rows written before they existed."""
+        while True:
+            rows = conn.execute(
+                "SELECT name, profile FROM doctors WHERE name_key IS NULL LIMIT 5000"
+            ).fetchall()
+            if not rows: return
+            with conn:
+                conn.executemany("UPDATE doctors SET name_key=?, npi=? WHERE name=?", [
+                    (name_key(name), profile_npi(json.loads(profile or "{}")), name) for name, profile in rows
+                ])
+                conn.executemany("INSERT OR IGNORE INTO name_blocks (key, name) VALUES (?, ?)",
+                                 [(key, name) for name, _ in rows for key in block_keys(name)])
+
+    def _backfill_changes(self, conn: sqlite3.Connection):
+        """Numbers rows written before change_seq existed, oldest first."""
+        rows = conn.execute(
+            "SELECT name FROM doctors WHERE change_seq IS NULL ORDER BY updated_at, name"
+        ).fetchall()
+        if not rows: return
+        with conn:
+            first = self._next_seq(conn, len(rows))
+            conn.executemany("UPDATE doctors SET change_seq=? WHERE name=?",
+                             [(first + i, name) for i, (name,) in enumerate(rows)])
+
+    def block_candidates(self, line: str, statuses=None) -> List[tuple]:
+        """(name, status) of stored doctors sharing a blocking key with `line`."""
+        keys = block_keys(line)
+        if not keys: return []
+        sql = (f"SELECT DISTINCT d.name, d.status FROM name_blocks b JOIN doctors d ON d.name = b.name "
+               f"WHERE b.key IN ({','.join('?' * len(keys))})")
+        params = list(keys)
+        if statuses:
+            sql += f" AND d.status IN ({','.join('?' * len(statuses))})"
+            params += list(statuses)
+        return self._conn().execute(sql, params).fetchall()
+
+    def find_by_npi(self, npi: str, statuses=None, exclude: Optional[str] = None) -> List[tuple]:
+        """(name, status, profile) of stored doctors carrying this NPI."""
+        sql = "SELECT name, status, profile FROM doctors WHERE npi=?"
+        params = [npi]
+        if statuses:
+            sql += f" AND status IN ({','.join('?' * len(statuses))})"
+            params += list(statuses)
+        if exclude:
+            sql += " AND name != ?"
+            params.append(exclude)
+        return [(n, st, json.loads(p or "{}")) for n, st, p in self._conn().execute(sql, params)]
+
+    # --- BULK RE-SCORING ---
+    def scoring_frames(self, statuses, chunksize: int = RESCORE_CHUNK) -> Iterator[pd.DataFrame]:
+        """
+        Scorer input columns for every doctor in `statuses`, in chunks. Reads
+        on its own connection, so the caller may write while iterating.
+        """
+        self.flush()
+        sql = (f"SELECT {SCORING_COLUMNS} FROM doctors "
+               f"WHERE status IN ({','.join('?' * len(statuses))})")
+        conn = self._connect()
+        try:
+            yield from pd.read_sql_query(sql, conn, params=list(statuses), chunksize=chunksize)
+        finally:
+            conn.close()
+
+    def apply_rescore(self, rows: List[tuple]) -> int:
+        """
+        rows: (status, final_score, details_patch_json, name). The patch is
+        merged into the stored details (JSON merge patch: null deletes a key).
+        Runs in one transaction; returns the number of rows updated.
+        """
+        if not rows: return 0
+        self.flush()
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            first = self._next_seq(conn, len(rows))
+            conn.executemany(
+                "UPDATE doctors SET status=?, final_score=?, details=json_patch(details, ?), updated_at=?, "
+                "change_seq=? WHERE name=?",
+                [(status, score, patch, now, first + i, name) for i, (status, score, patch, name) in enumerate(rows)]
+            )
+        return len(rows)
+
+    # --- EXPORTS ---
+    def iter_changed(self, statuses, since: int = 0, until: Optional[int] = None,
+                     chunksize: int = EXPORT_CHUNK) -> Iterator[tuple]:
+        """
+        (name, status, final_score, profile, change_seq) of every doctor in
+        `statuses` committed after change sequence `since` (up to `until`),
+        oldest first. Pages with keyset queries on idx_doctors_change, so
+        memory stays flat and each page is an index range scan.
+        """
+        self.flush()
+        status_sql = ','.join('?' * len(statuses))
+        sql = (f"SELECT name, status, final_score, profile, change_seq FROM doctors "
+               f"WHERE change_seq > ? AND +status IN ({status_sql})"
+               + (" AND change_seq <= ?" if until is not None else "") +
+               " ORDER BY change_seq LIMIT ?")
+        conn = self._connect()
+        try:
+            mark = since
+            while True:
+                params = [mark, *statuses] + ([until] if until is not None else []) + [chunksize]
+                rows = conn.execute(sql, params).fetchall()
+                for name, status, score, profile, seq in rows:
+                    yield name, status, score, json.loads(profile or "{}"), seq
+                if len(rows) < chunksize: return
+                mark = rows[-1][4]
+        finally:
+            conn.close()
+
+    def change_seq(self) -> int:
+        """Newest committed change sequence number."""
+        self.flush()
+        return self._conn().execute("SELECT seq FROM change_counter WHERE id = 0").fetchone()[0]
+
+    def get_watermark(self, target: str) -> int:
+        """Change sequence of the last record exported under `target` (0 if none)."""
+        row = self._conn().execute("SELECT change_seq FROM export_marks WHERE target=?", (target,)).fetchone()
+        return row[0] if row else 0
+
+    def set_watermark(self, target: str, seq: int):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO export_marks (target, change_seq, exported_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(target) DO UPDATE SET change_seq=excluded.change_seq, exported_at=excluded.exported_at",
+            (target, seq, time.time())
+        )
+        conn.commit()
+
+    # --- READS ---
+    def get_dataframe(self, status: Optional[str] = None, limit: Optional[int] = None, offset: int = 0) -> pd.DataFrame:
+        sql = f"SELECT {VIEW_COLUMNS} FROM doctors"
+        params = []
+        if status:
+            sql += " WHERE status=?"
+            params.append(status)
+        sql += " ORDER BY updated_at DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return pd.read_sql_query(sql, self._conn(), params=params)
+
+    def get_page(self, page: int = 0, page_size: int = PAGE_SIZE, status: Optional[str] = None) -> pd.DataFrame:
+        return self.get_dataframe(status=status, limit=page_size, offset=page * page_size)
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status:
+            return self._conn().execute("SELECT COUNT(*) FROM doctors WHERE status=?", (status,)).fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM doctors").fetchone()[0]
+
+    def status_counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM doctors GROUP BY status").fetchall()
+        return dict(rows)
+
+    def score_summary(self) -> Dict[str, float]:
+        avg, hi = self._conn().execute(
+            "SELECT AVG(final_score), MAX(final_score) FROM doctors WHERE status != 'Failed'"
+        ).fetchone()
+        return {"avg": round(avg or 0, 2), "max": round(hi or 0, 2)}
+
+    def get_profile(self, name: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT profile FROM doctors WHERE name=?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None